@@ -1,7 +1,6 @@
 import functools
 import time
 from typing import Dict, Callable
-from collections import defaultdict
 from telegram import Update
 from telegram.ext import ContextTypes
 from app.config import Config
@@ -10,23 +9,37 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+class TokenBucket:
+    """Per-user token bucket state for the rate limiter"""
+    __slots__ = ('tokens', 'last')
+
+    def __init__(self, tokens: float, last: float):
+        self.tokens = tokens
+        self.last = last
+
 # Rate limiting storage
-user_requests = defaultdict(list)
+user_buckets: Dict[int, TokenBucket] = {}
 
 def rate_limit(max_requests: int = Config.MAX_REQUESTS_PER_MINUTE, window: int = 60):
     """Rate limiting decorator"""
+    refill_rate = max_requests / window
+
     def decorator(func: Callable):
         @functools.wraps(func)
         async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
             user_id = update.effective_user.id
-            current_time = time.time()
+            current_time = time.monotonic()
 
-            # Clean old requests
-            user_requests[user_id] = [req_time for req_time in user_requests[user_id] 
-                                    if current_time - req_time < window]
+            # Refill tokens for the time elapsed since the last request
+            bucket = user_buckets.get(user_id)
+            if bucket is None:
+                bucket = user_buckets[user_id] = TokenBucket(max_requests, current_time)
+            else:
+                bucket.tokens = min(max_requests, bucket.tokens + (current_time - bucket.last) * refill_rate)
+                bucket.last = current_time
 
             # Check rate limit
-            if len(user_requests[user_id]) >= max_requests:
+            if bucket.tokens < 1:
                 await update.message.reply_text(
                     "⚠️ **Rate limit exceeded!**\n"
                     f"Please wait before making more requests. "
@@ -35,8 +48,8 @@ def rate_limit(max_requests: int = Config.MAX_REQUESTS_PER_MINUTE, window: int =
                 )
                 return
 
-            # Add current request
-            user_requests[user_id].append(current_time)
+            # Consume a token for the current request
+            bucket.tokens -= 1
 
             return await func(update, context, *args, **kwargs)
         return wrapper
@@ -47,7 +60,8 @@ def require_authorization(func: Callable):
     @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        db = Database()
+        # The bot's shared Database, stored in bot_data at startup
+        db: Database = context.bot_data['db']
 
         user = await db.get_user(user_id)
         if not user:
@@ -91,7 +105,8 @@ def require_active_api(func: Callable):
     @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        db = Database()
+        # The bot's shared Database, stored in bot_data at startup
+        db: Database = context.bot_data['db']
 
         active_api = await db.get_active_api(user_id)
         if not active_api:
@@ -1,4 +1,6 @@
 import os
+import base64
+import hashlib
 from typing import List
 
 class Config:
@@ -8,8 +10,23 @@ class Config:
     # Database - Render PostgreSQL
     DATABASE_URL = os.getenv('DATABASE_URL')
 
+    # Connection pool sizing - keep DB_POOL_MAX within the plan's max_connections
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '2'))
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '25'))
+    # Per-statement timeout in seconds, so a stuck query cannot pin a pooled connection
+    DB_COMMAND_TIMEOUT = int(os.getenv('DB_COMMAND_TIMEOUT', '10'))
+
     # Security
     ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')
+    MIN_ENCRYPTION_KEY_LENGTH = 32
+
+    # Fernet keys, derived once at load. FERNET_KEY is a SHA-256 digest of the
+    # whole ENCRYPTION_KEY; LEGACY_FERNET_KEY is the old pad/truncate-to-32
+    # derivation, kept only so tokens stored before the change still decrypt.
+    FERNET_KEY = base64.urlsafe_b64encode(hashlib.sha256(ENCRYPTION_KEY.encode()).digest()) if ENCRYPTION_KEY else None
+    LEGACY_FERNET_KEY = base64.urlsafe_b64encode(ENCRYPTION_KEY.encode().ljust(32)[:32]) if ENCRYPTION_KEY else None
+    # AES-256-GCM key for newly stored tokens, kept separate from the Fernet key
+    AESGCM_KEY = hashlib.sha256(b'aes-gcm:' + ENCRYPTION_KEY.encode()).digest() if ENCRYPTION_KEY else None
 
     # Hardcoded Admin User IDs - Add your admin IDs here
     HARDCODED_ADMIN_IDS = [
@@ -27,12 +44,16 @@ class Config:
     except (ValueError, AttributeError):
         ENV_ADMIN_IDS = []
 
-    # Combined admin list (hardcoded takes priority)
-    ADMIN_USER_IDS = list(set(HARDCODED_ADMIN_IDS + ENV_ADMIN_IDS))
+    # Combined admin set (hardcoded takes priority); a frozenset keeps
+    # membership checks O(1)
+    ADMIN_USER_IDS = frozenset(HARDCODED_ADMIN_IDS + ENV_ADMIN_IDS)
 
     # Rate limiting
     MAX_REQUESTS_PER_MINUTE = 30
 
+    # Seconds to keep user / active API lookups in the in-process cache
+    CACHE_TTL = 60
+
     # GitHub API
     GITHUB_API_BASE = 'https://api.github.com'
 
@@ -43,13 +64,14 @@ class Config:
         if missing:
             raise ValueError(f"Missing required environment variables: {missing}")
 
+        if len(cls.ENCRYPTION_KEY) < cls.MIN_ENCRYPTION_KEY_LENGTH:
+            raise ValueError(f"ENCRYPTION_KEY must be at least {cls.MIN_ENCRYPTION_KEY_LENGTH} characters long")
+
         if not cls.ADMIN_USER_IDS:
             raise ValueError("No admin user IDs specified (check hardcoded admin IDs in config.py)")
 
-    @classmethod
-    def is_admin(cls, user_id: int) -> bool:
-        """Check if user is an admin"""
-        return user_id in cls.ADMIN_USER_IDS
+    # Check if user is an admin; bound straight to the set's membership test
+    is_admin = staticmethod(ADMIN_USER_IDS.__contains__)
 
     @classmethod
     def get_admin_count(cls) -> int:
@@ -1,15 +1,17 @@
 import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional, Tuple
 import logging
 import traceback
-import base64
-from cryptography.fernet import Fernet
+import hashlib
 import os
+import weakref
 
 try:
     import psycopg2
-    from psycopg2.extras import RealDictCursor
+    from psycopg2.extras import RealDictCursor, execute_values
     from psycopg2 import pool
     PSYCOPG2_AVAILABLE = True
 except ImportError as e:
@@ -17,11 +19,36 @@ except ImportError as e:
     PSYCOPG2_AVAILABLE = False
 
 from app.config import Config
+from app.encryption import get_cipher, encrypt_token, decrypt_token
 
 logger = logging.getLogger(__name__)
 
 class Database:
-    def __init__(self):
+    # Per-user lookup caches, shared by every Database instance in the process
+    # so that invalidation from one instance is seen by all of them
+    _user_cache: Dict[int, Tuple[float, Dict]] = {}
+    _active_api_cache: Dict[int, Tuple[float, Dict]] = {}
+    _user_apis_cache: Dict[int, Tuple[float, List[Dict]]] = {}
+
+    # Audit log batching: up to LOG_BATCH_SIZE queued records are written in one
+    # transaction, waiting at most LOG_FLUSH_INTERVAL seconds for a batch to fill
+    LOG_BATCH_SIZE = 100
+    LOG_FLUSH_INTERVAL = 0.1
+    # Audit log rows written straight away carry no timestamp; the server stamps them
+    _LOG_NOW_TEMPLATE = "(%s, %s, %s, NOW(), %s)"
+
+    # Server-side prepared statements for the lookups run on nearly every update,
+    # so PostgreSQL parses and plans them once per connection
+    PREPARED_STATEMENTS = {
+        'get_user': "SELECT user_id, username, is_authorized FROM users WHERE user_id = $1",
+        'get_active_api': """
+            SELECT id, user_id, api_name, github_token, github_username, is_active, created_at, to_char(created_at, 'YYYY-MM-DD') AS created_date
+            FROM github_apis WHERE user_id = $1 AND is_active
+        """,
+    }
+
+    def __init__(self, min_size: Optional[int] = None, max_size: Optional[int] = None):
+        """Pool bounds default to Config.DB_POOL_MIN / Config.DB_POOL_MAX"""
         if not PSYCOPG2_AVAILABLE:
             raise ImportError("psycopg2 client not available")
 
@@ -31,14 +58,31 @@ class Database:
             # Get database URL from config
             self.database_url = Config.DATABASE_URL
 
-            # Create connection pool
+            max_size = max_size or Config.DB_POOL_MAX
+            min_size = min(min_size or Config.DB_POOL_MIN, max_size)
+
+            # Create connection pool (opens min_size connections up front)
             self.connection_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=1,
-                maxconn=20,
+                minconn=min_size,
+                maxconn=max_size,
                 dsn=self.database_url,
-                cursor_factory=RealDictCursor
+                cursor_factory=RealDictCursor,
+                options=f"-c statement_timeout={Config.DB_COMMAND_TIMEOUT * 1000}"
             )
 
+            # psycopg2 is blocking, so queries run on worker threads; one thread
+            # per pooled connection keeps the pool from ever being exhausted
+            self._executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix='db')
+
+            # Pending audit log records, written by a background flusher task
+            self._log_queue: asyncio.Queue = asyncio.Queue()
+            self._log_flusher_task: Optional[asyncio.Task] = None
+            # Queued records the flusher failed to write, reported by flush_logs
+            self._lost_log_records = 0
+
+            # Pooled connections that already have PREPARED_STATEMENTS defined
+            self._prepared_connections = weakref.WeakSet()
+
             logger.info("✅ Render PostgreSQL connection pool created successfully")
 
             # Initialize encryption
@@ -55,33 +99,17 @@ class Database:
     def _init_encryption(self):
         """Initialize encryption cipher"""
         try:
-            # Create cipher from config key
-            key = Config.ENCRYPTION_KEY.encode()
-            key = base64.urlsafe_b64encode(key.ljust(32)[:32])
-            self.cipher = Fernet(key)
+            # Shared cipher, built once per process from the config key
+            self.cipher = get_cipher()
             logger.debug("✅ Encryption initialized")
         except Exception as e:
             logger.error(f"❌ Failed to initialize encryption: {e}")
             raise
 
-    def _encrypt_token(self, token: str) -> str:
-        """Encrypt GitHub token"""
-        try:
-            encrypted = self.cipher.encrypt(token.encode())
-            return base64.b64encode(encrypted).decode()
-        except Exception as e:
-            logger.error(f"❌ Failed to encrypt token: {e}")
-            raise
-
-    def _decrypt_token(self, encrypted_token: str) -> str:
-        """Decrypt GitHub token"""
-        try:
-            encrypted_bytes = base64.b64decode(encrypted_token.encode())
-            decrypted = self.cipher.decrypt(encrypted_bytes)
-            return decrypted.decode()
-        except Exception as e:
-            logger.error(f"❌ Failed to decrypt token: {e}")
-            raise
+    @staticmethod
+    def _hash_token(token: str) -> bytes:
+        """SHA-256 digest of a GitHub token, used for indexed lookups"""
+        return hashlib.sha256(token.encode()).digest()
 
     def _get_connection(self):
         """Get a connection from the pool"""
@@ -91,6 +119,70 @@ class Database:
         """Return a connection to the pool"""
         self.connection_pool.putconn(conn)
 
+    def _run_sync(self, work: Callable[[Any], Any]) -> Any:
+        """Run ``work(cursor)`` on a pooled connection and commit, rolling back on error"""
+        conn = self._get_connection()
+        try:
+            with conn.cursor() as cursor:
+                result = work(cursor)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._put_connection(conn)
+
+    def _prepare(self, cursor):
+        """Define the prepared statements on the cursor's connection if needed"""
+        conn = cursor.connection
+        if conn not in self._prepared_connections:
+            for name, sql in self.PREPARED_STATEMENTS.items():
+                cursor.execute(f"PREPARE {name} AS {sql}")
+            self._prepared_connections.add(conn)
+
+    async def _run(self, work: Callable[[Any], Any]) -> Any:
+        """Run a blocking query off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_sync, work)
+
+    @staticmethod
+    def _cache_get(cache: Dict[int, Tuple[float, Dict]], user_id: int) -> Optional[Dict]:
+        """Return a copy of a cached row if it has not expired"""
+        entry = cache.get(user_id)
+        if entry is None:
+            return None
+        cached_at, row = entry
+        if time.monotonic() - cached_at >= Config.CACHE_TTL:
+            cache.pop(user_id, None)
+            return None
+        return dict(row)
+
+    @staticmethod
+    def _cache_put(cache: Dict[int, Tuple[float, Dict]], user_id: int, row: Dict):
+        """Store a copy of a row in the cache"""
+        cache[user_id] = (time.monotonic(), dict(row))
+
+    def _refresh_user(self, user_id: int, row: Optional[Dict]):
+        """Cache the row a write returned, or drop the entry if there was none"""
+        if row:
+            self._cache_put(self._user_cache, user_id, row)
+        else:
+            self._invalidate_user(user_id)
+
+    def _invalidate_user(self, user_id: int):
+        """Drop cached user row"""
+        self._user_cache.pop(user_id, None)
+
+    def _invalidate_active_api(self, user_id: int):
+        """Drop cached active API row"""
+        self._active_api_cache.pop(user_id, None)
+
+    def _invalidate_apis(self, user_id: int):
+        """Drop the cached API list and active API row"""
+        self._user_apis_cache.pop(user_id, None)
+        self._invalidate_active_api(user_id)
+
     def _test_connection(self):
         """Test database connection"""
         try:
@@ -109,78 +201,103 @@ class Database:
 
     # User Management
     async def create_user(self, user_id: int, username: str) -> bool:
+        def insert(cursor):
+            # Single round-trip; an existing user is left untouched
+            cursor.execute("""
+                INSERT INTO users (user_id, username, is_authorized, created_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING user_id, username, is_authorized
+            """, (user_id, username, False))
+            return cursor.fetchone()
+
         try:
             logger.info(f"👤 Creating user: {user_id} ({username})")
 
-            # Check if user already exists
-            existing = await self.get_user(user_id)
-            if existing:
-                logger.info(f"ℹ️ User {user_id} already exists")
-                return True
-
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        INSERT INTO users (user_id, username, is_authorized, created_at)
-                        VALUES (%s, %s, %s, %s)
-                    """, (user_id, username, False, datetime.utcnow()))
-                    conn.commit()
-
+            user = await self._run(insert)
+            if user:
+                # Cache the new row so a following get_user needs no round trip
+                self._cache_put(self._user_cache, user_id, user)
                 logger.info(f"✅ User created successfully: {user_id}")
-                return True
-            finally:
-                self._put_connection(conn)
+            else:
+                logger.info(f"ℹ️ User {user_id} already exists")
+            return True
 
         except Exception as e:
             logger.error(f"❌ Error creating user {user_id}: {e}")
             return False
 
+    async def upsert_user(self, user_id: int, username: str) -> Optional[Dict]:
+        """Create the user or refresh their username, returning the stored row"""
+        def upsert(cursor):
+            cursor.execute("""
+                INSERT INTO users (user_id, username, is_authorized, created_at)
+                VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username
+                RETURNING user_id, username, is_authorized
+            """, (user_id, username, False))
+            return cursor.fetchone()
+
+        try:
+            user = dict(await self._run(upsert))
+            self._cache_put(self._user_cache, user_id, user)
+            logger.debug(f"👤 User {user_id} upserted - authorized: {user.get('is_authorized')}")
+            return user
+        except Exception as e:
+            logger.error(f"❌ Error upserting user {user_id}: {e}")
+            return None
+
     async def get_user(self, user_id: int) -> Optional[Dict]:
+        cached = self._cache_get(self._user_cache, user_id)
+        if cached is not None:
+            return cached
+
+        def select(cursor):
+            self._prepare(cursor)
+            cursor.execute("EXECUTE get_user(%s)", (user_id,))
+            return cursor.fetchone()
+
         try:
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-                    user = cursor.fetchone()
-                    if user:
-                        user = dict(user)
-                        logger.debug(f"👤 User {user_id} found - authorized: {user.get('is_authorized')}")
-                    return user
-            finally:
-                self._put_connection(conn)
+            user = await self._run(select)
+            if user:
+                user = dict(user)
+                self._cache_put(self._user_cache, user_id, user)
+                logger.debug(f"👤 User {user_id} found - authorized: {user.get('is_authorized')}")
+            return user
         except Exception as e:
             logger.error(f"❌ Error getting user {user_id}: {e}")
             return None
 
     async def authorize_user(self, user_id: int) -> bool:
+        def update(cursor):
+            cursor.execute("""
+                UPDATE users SET is_authorized = %s WHERE user_id = %s
+                RETURNING user_id, username, is_authorized
+            """, (True, user_id))
+            return cursor.fetchone()
+
         try:
             logger.info(f"🔐 Authorizing user: {user_id}")
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("UPDATE users SET is_authorized = %s WHERE user_id = %s", (True, user_id))
-                    conn.commit()
-                logger.info(f"✅ User {user_id} authorized successfully")
-                return True
-            finally:
-                self._put_connection(conn)
+            self._refresh_user(user_id, await self._run(update))
+            logger.info(f"✅ User {user_id} authorized successfully")
+            return True
         except Exception as e:
             logger.error(f"❌ Error authorizing user {user_id}: {e}")
             return False
 
     async def revoke_user(self, user_id: int) -> bool:
+        def update(cursor):
+            cursor.execute("""
+                UPDATE users SET is_authorized = %s WHERE user_id = %s
+                RETURNING user_id, username, is_authorized
+            """, (False, user_id))
+            return cursor.fetchone()
+
         try:
             logger.info(f"🚫 Revoking user: {user_id}")
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("UPDATE users SET is_authorized = %s WHERE user_id = %s", (False, user_id))
-                    conn.commit()
-                logger.info(f"✅ User {user_id} revoked successfully")
-                return True
-            finally:
-                self._put_connection(conn)
+            self._refresh_user(user_id, await self._run(update))
+            logger.info(f"✅ User {user_id} revoked successfully")
+            return True
         except Exception as e:
             logger.error(f"❌ Error revoking user {user_id}: {e}")
             return False
@@ -191,176 +308,373 @@ class Database:
             logger.info(f"📝 Adding GitHub API '{api_name}' for user {user_id}")
 
             # Encrypt the token
-            encrypted_token = self._encrypt_token(github_token)
+            encrypted_token = encrypt_token(github_token)
+            token_hash = self._hash_token(github_token)
+
+            def upsert(cursor):
+                # Insert, or replace the token of an existing API with this name,
+                # in one round trip; xmax is 0 only for a freshly inserted row
+                cursor.execute("""
+                    INSERT INTO github_apis (user_id, api_name, github_token, token_hash, github_username, is_active, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                    ON CONFLICT (user_id, api_name) DO UPDATE
+                    SET github_token = EXCLUDED.github_token, token_hash = EXCLUDED.token_hash,
+                        github_username = EXCLUDED.github_username, verified = TRUE, created_at = NOW()
+                    RETURNING xmax = 0 AS inserted
+                """, (user_id, api_name, encrypted_token, token_hash, github_username, False))
+                if cursor.fetchone()['inserted']:
+                    logger.info(f"✅ Added new API '{api_name}' for user {user_id}")
+                else:
+                    logger.info(f"✅ Updated existing API '{api_name}' for user {user_id}")
+
+            await self._run(upsert)
+            self._invalidate_apis(user_id)
+            return True
 
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    # Check if API name already exists for this user
-                    cursor.execute("SELECT id FROM github_apis WHERE user_id = %s AND api_name = %s", (user_id, api_name))
-                    existing = cursor.fetchone()
-
-                    if existing:
-                        # Update existing
-                        cursor.execute("""
-                            UPDATE github_apis
-                            SET github_token = %s, github_username = %s, created_at = %s
-                            WHERE user_id = %s AND api_name = %s
-                        """, (encrypted_token, github_username, datetime.utcnow(), user_id, api_name))
-                        logger.info(f"✅ Updated existing API '{api_name}' for user {user_id}")
-                    else:
-                        # Insert new
-                        cursor.execute("""
-                            INSERT INTO github_apis (user_id, api_name, github_token, github_username, is_active, created_at)
-                            VALUES (%s, %s, %s, %s, %s, %s)
-                        """, (user_id, api_name, encrypted_token, github_username, False, datetime.utcnow()))
-                        logger.info(f"✅ Added new API '{api_name}' for user {user_id}")
-
-                    conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Error adding GitHub API: {e}")
+            return False
+
+    async def add_github_api_tentative(self, user_id: int, api_name: str, github_token: str) -> bool:
+        """Insert an unverified API row while its token is validated; False if the name is taken"""
+        encrypted_token = encrypt_token(github_token)
+        token_hash = self._hash_token(github_token)
+
+        def insert(cursor):
+            cursor.execute("""
+                INSERT INTO github_apis (user_id, api_name, github_token, token_hash, github_username, is_active, verified, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                ON CONFLICT (user_id, api_name) DO NOTHING
+                RETURNING id
+            """, (user_id, api_name, encrypted_token, token_hash, '', False, False))
+            return cursor.fetchone() is not None
+
+        try:
+            return await self._run(insert)
+        except Exception as e:
+            logger.error(f"❌ Error adding tentative GitHub API: {e}")
+            return False
+
+    async def mark_api_verified(self, user_id: int, api_name: str, github_username: str) -> bool:
+        """Confirm a tentative API row once its token has been validated"""
+        def update(cursor):
+            cursor.execute("""
+                UPDATE github_apis SET verified = TRUE, github_username = %s
+                WHERE user_id = %s AND api_name = %s AND NOT verified
+            """, (github_username, user_id, api_name))
+            return cursor.rowcount > 0
+
+        try:
+            if await self._run(update):
+                self._user_apis_cache.pop(user_id, None)
+                logger.info(f"✅ Added new API '{api_name}' for user {user_id}")
                 return True
-            finally:
-                self._put_connection(conn)
+            return False
+        except Exception as e:
+            logger.error(f"❌ Error verifying GitHub API: {e}")
+            return False
 
+    async def discard_tentative_api(self, user_id: int, api_name: str) -> bool:
+        """Delete a tentative API row whose token failed validation"""
+        def delete(cursor):
+            cursor.execute(
+                "DELETE FROM github_apis WHERE user_id = %s AND api_name = %s AND NOT verified",
+                (user_id, api_name)
+            )
+
+        try:
+            await self._run(delete)
+            return True
         except Exception as e:
-            logger.error(f"❌ Error adding GitHub API: {e}")
+            logger.error(f"❌ Error discarding tentative GitHub API: {e}")
             return False
 
     async def get_user_apis(self, user_id: int) -> List[Dict]:
+        entry = self._user_apis_cache.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < Config.CACHE_TTL:
+            return [dict(api) for api in entry[1]]
+
+        def select(cursor):
+            cursor.execute("""
+                SELECT id, user_id, api_name, github_username, is_active, created_at, to_char(created_at, 'YYYY-MM-DD') AS created_date
+                FROM github_apis WHERE user_id = %s AND verified ORDER BY created_at DESC
+            """, (user_id,))
+            return cursor.fetchall()
+
         try:
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT * FROM github_apis WHERE user_id = %s ORDER BY created_at DESC", (user_id,))
-                    apis = [dict(row) for row in cursor.fetchall()]
-                    logger.debug(f"📋 Found {len(apis)} APIs for user {user_id}")
-                    return apis
-            finally:
-                self._put_connection(conn)
+            apis = [dict(row) for row in await self._run(select)]
+            self._user_apis_cache[user_id] = (time.monotonic(), [dict(api) for api in apis])
+            logger.debug(f"📋 Found {len(apis)} APIs for user {user_id}")
+            return apis
         except Exception as e:
             logger.error(f"❌ Error getting user APIs: {e}")
             return []
 
+    async def api_exists(self, user_id: int, api_name: str) -> bool:
+        def select(cursor):
+            cursor.execute("SELECT 1 FROM github_apis WHERE user_id = %s AND api_name = %s AND verified LIMIT 1", (user_id, api_name))
+            return cursor.fetchone() is not None
+
+        try:
+            return await self._run(select)
+        except Exception as e:
+            logger.error(f"❌ Error checking API existence: {e}")
+            return False
+
+    async def get_api(self, user_id: int, api_name: str) -> Optional[Dict]:
+        def select(cursor):
+            cursor.execute("""
+                SELECT id, user_id, api_name, github_username, is_active, created_at, to_char(created_at, 'YYYY-MM-DD') AS created_date
+                FROM github_apis WHERE user_id = %s AND api_name = %s AND verified
+            """, (user_id, api_name))
+            return cursor.fetchone()
+
+        try:
+            row = await self._run(select)
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"❌ Error getting API: {e}")
+            return None
+
     async def get_active_api(self, user_id: int) -> Optional[Dict]:
+        cached = self._cache_get(self._active_api_cache, user_id)
+        if cached is not None:
+            return cached
+
+        def select(cursor):
+            self._prepare(cursor)
+            cursor.execute("EXECUTE get_active_api(%s)", (user_id,))
+            return cursor.fetchone()
+
         try:
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT * FROM github_apis WHERE user_id = %s AND is_active = %s", (user_id, True))
-                    api_data = cursor.fetchone()
-                    if api_data:
-                        api_data = dict(api_data)
-                        # Decrypt the token
-                        api_data['github_token'] = self._decrypt_token(api_data['github_token'])
-                        logger.debug(f"🔧 Found active API for user {user_id}: {api_data['api_name']}")
-                        return api_data
-                    logger.debug(f"ℹ️ No active API found for user {user_id}")
-                    return None
-            finally:
-                self._put_connection(conn)
+            api_data = await self._run(select)
+            if api_data:
+                api_data = dict(api_data)
+                # Decrypt the token
+                api_data['github_token'] = decrypt_token(api_data['github_token'])
+                self._cache_put(self._active_api_cache, user_id, api_data)
+                logger.debug(f"🔧 Found active API for user {user_id}: {api_data['api_name']}")
+                return api_data
+            logger.debug(f"ℹ️ No active API found for user {user_id}")
+            return None
         except Exception as e:
             logger.error(f"❌ Error getting active API: {e}")
             return None
 
-    async def set_active_api(self, user_id: int, api_name: str) -> bool:
+    async def get_api_by_token(self, github_token: str) -> Optional[Dict]:
+        """Find a stored API by its plaintext token without decrypting every row"""
+        token_hash = self._hash_token(github_token)
+
+        def select(cursor):
+            cursor.execute("""
+                SELECT id, user_id, api_name, github_token, github_username, is_active, created_at
+                FROM github_apis WHERE token_hash = %s AND verified LIMIT 1
+            """, (token_hash,))
+            return cursor.fetchone()
+
         try:
-            logger.info(f"⚙️ Setting active API '{api_name}' for user {user_id}")
+            api_data = await self._run(select)
+            if api_data:
+                api_data = dict(api_data)
+                api_data['github_token'] = decrypt_token(api_data['github_token'])
+                logger.debug(f"🔧 Found API '{api_data['api_name']}' for user {api_data['user_id']} by token")
+                return api_data
+            return None
+        except Exception as e:
+            logger.error(f"❌ Error getting API by token: {e}")
+            return None
 
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    # First, deactivate all APIs for user
-                    cursor.execute("UPDATE github_apis SET is_active = %s WHERE user_id = %s", (False, user_id))
-
-                    # Then activate the selected API
-                    cursor.execute("UPDATE github_apis SET is_active = %s WHERE user_id = %s AND api_name = %s",
-                                 (True, user_id, api_name))
-
-                    if cursor.rowcount > 0:
-                        conn.commit()
-                        logger.info(f"✅ Set active API '{api_name}' for user {user_id}")
-                        return True
-                    else:
-                        logger.warning(f"⚠️ API '{api_name}' not found for user {user_id}")
-                        return False
-            finally:
-                self._put_connection(conn)
+    async def set_active_api(self, user_id: int, api_name: str) -> bool:
+        def update(cursor):
+            # Activate the selected API and deactivate the rest in one statement,
+            # touching only rows whose state changes. Nothing is updated when
+            # the API does not exist, so the current one stays active.
+            cursor.execute("""
+                UPDATE github_apis SET is_active = (api_name = %s)
+                WHERE user_id = %s AND (is_active OR api_name = %s)
+                  AND EXISTS (SELECT 1 FROM github_apis WHERE user_id = %s AND api_name = %s AND verified)
+                RETURNING id, user_id, api_name, github_token, github_username, is_active, created_at, to_char(created_at, 'YYYY-MM-DD') AS created_date
+            """, (api_name, user_id, api_name, user_id, api_name))
+            return cursor.fetchall()
 
+        try:
+            logger.info(f"⚙️ Setting active API '{api_name}' for user {user_id}")
+            rows = await self._run(update)
         except Exception as e:
             logger.error(f"❌ Error setting active API: {e}")
             return False
 
+        if not rows:
+            logger.warning(f"⚠️ API '{api_name}' not found for user {user_id}")
+            return False
+
+        # The switch is committed: drop the old rows before anything else can fail
+        self._invalidate_apis(user_id)
+        logger.info(f"✅ Set active API '{api_name}' for user {user_id}")
+
+        try:
+            # The selected API is always among the updated rows; cache it so a
+            # following get_active_api needs no round trip
+            active = next(dict(row) for row in rows if row['is_active'])
+            active['github_token'] = decrypt_token(active['github_token'])
+            self._cache_put(self._active_api_cache, user_id, active)
+        except Exception as e:
+            logger.error(f"❌ Error caching active API for user {user_id}: {e}")
+        return True
+
     async def remove_github_api(self, user_id: int, api_name: str) -> bool:
+        def delete(cursor):
+            cursor.execute("DELETE FROM github_apis WHERE user_id = %s AND api_name = %s", (user_id, api_name))
+
         try:
             logger.info(f"🗑️ Removing API '{api_name}' for user {user_id}")
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("DELETE FROM github_apis WHERE user_id = %s AND api_name = %s", (user_id, api_name))
-                    conn.commit()
-                logger.info(f"✅ Removed API '{api_name}' for user {user_id}")
-                return True
-            finally:
-                self._put_connection(conn)
+            await self._run(delete)
+            self._invalidate_apis(user_id)
+            logger.info(f"✅ Removed API '{api_name}' for user {user_id}")
+            return True
         except Exception as e:
             logger.error(f"❌ Error removing GitHub API: {e}")
             return False
 
     # Repository Management
     async def update_repository_status(self, user_id: int, repo_name: str, owner: str, visibility: str) -> bool:
+        def upsert(cursor):
+            # Upsert repository status
+            cursor.execute("""
+                INSERT INTO repositories (user_id, repo_name, owner, current_visibility, last_modified)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON CONFLICT (user_id, repo_name, owner)
+                DO UPDATE SET current_visibility = EXCLUDED.current_visibility,
+                             last_modified = EXCLUDED.last_modified
+            """, (user_id, repo_name, owner, visibility))
+
         try:
             logger.debug(f"📊 Updating repo status: {owner}/{repo_name} -> {visibility}")
-
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    # Upsert repository status
-                    cursor.execute("""
-                        INSERT INTO repositories (user_id, repo_name, owner, current_visibility, last_modified)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (user_id, repo_name, owner)
-                        DO UPDATE SET current_visibility = EXCLUDED.current_visibility,
-                                     last_modified = EXCLUDED.last_modified
-                    """, (user_id, repo_name, owner, visibility, datetime.utcnow()))
-                    conn.commit()
-                return True
-            finally:
-                self._put_connection(conn)
+            await self._run(upsert)
+            return True
         except Exception as e:
             logger.error(f"❌ Error updating repository status: {e}")
             return False
 
+    async def update_repository_status_bulk(self, user_id: int, rows: List[Tuple[str, str, str]]) -> bool:
+        """Upsert many (repo_name, owner, visibility) rows in one transaction"""
+        if not rows:
+            return True
+
+        def upsert(cursor):
+            execute_values(cursor, """
+                INSERT INTO repositories (user_id, repo_name, owner, current_visibility, last_modified)
+                VALUES %s
+                ON CONFLICT (user_id, repo_name, owner)
+                DO UPDATE SET current_visibility = EXCLUDED.current_visibility,
+                             last_modified = EXCLUDED.last_modified
+            """, [(user_id, repo_name, owner, visibility) for repo_name, owner, visibility in rows],
+                template="(%s, %s, %s, %s, NOW())", page_size=200)
+
+        try:
+            logger.debug(f"📊 Updating {len(rows)} repo statuses for user {user_id}")
+            await self._run(upsert)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error updating repository statuses: {e}")
+            return False
+
     # Audit Logging
+    def queue_log(self, user_id: int, action: str, repository: str, status: str):
+        """Queue an audit log record without waiting; it is written with the next batch"""
+        logger.debug(f"📝 Logging action: {action} on {repository} - {status}")
+        # Timestamped here rather than with NOW(): the row is written later, in a batch
+        self._log_queue.put_nowait((user_id, action, repository, datetime.utcnow(), status))
+        if self._log_flusher_task is None or self._log_flusher_task.done():
+            self._log_flusher_task = asyncio.get_running_loop().create_task(self._log_flusher())
+
     async def log_action(self, user_id: int, action: str, repository: str, status: str) -> bool:
-        try:
-            logger.debug(f"📝 Logging action: {action} on {repository} - {status}")
+        """Write one audit log record now; use queue_log when the result is not needed"""
+        logger.debug(f"📝 Logging action: {action} on {repository} - {status}")
+        return await self._write_logs([(user_id, action, repository, status)], self._LOG_NOW_TEMPLATE)
+
+    async def bulk_log_action(self, user_id: int, rows: List[Tuple[str, str, str]]) -> bool:
+        """Write many (action, repository, status) records for one user in one statement"""
+        if not rows:
+            return True
+        return await self._write_logs([(user_id, action, repository, status)
+                                       for action, repository, status in rows], self._LOG_NOW_TEMPLATE)
+
+    async def _log_flusher(self):
+        """Drain the audit log queue in batches"""
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = [await self._log_queue.get()]
+
+            # Give a burst of actions a moment to land in the same batch
+            deadline = loop.time() + self.LOG_FLUSH_INTERVAL
+            while len(rows) < self.LOG_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self._log_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            if not await self._write_logs(rows):
+                self._lost_log_records += len(rows)
+            for _ in rows:
+                self._log_queue.task_done()
+
+    async def _write_logs(self, rows: List[Tuple], template: Optional[str] = None) -> bool:
+        """Insert audit log rows; without a template each row carries its own timestamp"""
+        def insert(cursor):
+            execute_values(cursor, """
+                INSERT INTO audit_logs (user_id, action, repository, timestamp, status)
+                VALUES %s
+            """, rows, template=template, page_size=1000)
 
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        INSERT INTO audit_logs (user_id, action, repository, timestamp, status)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """, (user_id, action, repository, datetime.utcnow(), status))
-                    conn.commit()
-                return True
-            finally:
-                self._put_connection(conn)
+        try:
+            await self._run(insert)
+            logger.debug(f"📝 Wrote {len(rows)} audit log records")
+            return True
         except Exception as e:
-            logger.error(f"❌ Error logging action: {e}")
+            logger.error(f"❌ Error logging {len(rows)} actions: {e}")
             return False
 
+    async def flush_logs(self) -> bool:
+        """Wait until every queued audit log record has been written
+
+        Returns False if any queued record failed to write since the last flush.
+        """
+        if self._log_flusher_task is not None and not self._log_flusher_task.done():
+            await self._log_queue.join()
+        lost, self._lost_log_records = self._lost_log_records, 0
+        if lost:
+            logger.error(f"❌ {lost} queued audit log records were not written")
+        return not lost
+
     async def get_user_logs(self, user_id: int, limit: int = 10) -> List[Dict]:
+        # Make sure the user's most recent actions are visible
+        await self.flush_logs()
+
+        def select(cursor):
+            cursor.execute("""
+                SELECT action, repository, timestamp, status
+                FROM audit_logs WHERE user_id = %s ORDER BY timestamp DESC LIMIT %s
+            """, (user_id, limit))
+            return cursor.fetchall()
+
         try:
-            conn = self._get_connection()
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT * FROM audit_logs WHERE user_id = %s ORDER BY timestamp DESC LIMIT %s",
-                                 (user_id, limit))
-                    logs = [dict(row) for row in cursor.fetchall()]
-                    logger.debug(f"📋 Found {len(logs)} logs for user {user_id}")
-                    return logs
-            finally:
-                self._put_connection(conn)
+            logs = [dict(row) for row in await self._run(select)]
+            logger.debug(f"📋 Found {len(logs)} logs for user {user_id}")
+            return logs
         except Exception as e:
             logger.error(f"❌ Error getting user logs: {e}")
             return []
+
+    async def close(self):
+        """Flush pending audit logs and release pooled connections"""
+        await self.flush_logs()
+        if self._log_flusher_task is not None:
+            self._log_flusher_task.cancel()
+            self._log_flusher_task = None
+        self._executor.shutdown(wait=True)
+        self.connection_pool.closeall()
+        logger.info("✅ Database connections closed")
@@ -1,20 +1,44 @@
-from cryptography.fernet import Fernet
+import functools
+import os
+from cryptography.fernet import Fernet, MultiFernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from app.config import Config
 import base64
 
+# Every Fernet token starts with the version byte 0x80, i.e. "gA" once encoded
+FERNET_TOKEN_PREFIX = 'gA'
+
+# AES-GCM tokens are url-safe base64 of version byte || nonce || ciphertext+tag;
+# version byte 0x01 encodes to a leading "A", which neither older format uses
+AESGCM_TOKEN_VERSION = b'\x01'
+AESGCM_TOKEN_PREFIX = 'A'
+AESGCM_NONCE_SIZE = 12
+
+@functools.lru_cache(maxsize=1)
 def get_cipher():
-    key = Config.ENCRYPTION_KEY.encode()
-    # Ensure key is proper length for Fernet
-    key = base64.urlsafe_b64encode(key.ljust(32)[:32])
-    return Fernet(key)
+    # Decrypts Fernet tokens stored before AES-GCM, under either key
+    return MultiFernet([Fernet(Config.FERNET_KEY), Fernet(Config.LEGACY_FERNET_KEY)])
+
+@functools.lru_cache(maxsize=1)
+def get_aead():
+    # Encrypts every new token; AES-GCM runs on AES-NI through OpenSSL
+    return AESGCM(Config.AESGCM_KEY)
 
 def encrypt_token(token: str) -> str:
-    cipher = get_cipher()
-    encrypted = cipher.encrypt(token.encode())
-    return base64.b64encode(encrypted).decode()
+    nonce = os.urandom(AESGCM_NONCE_SIZE)
+    sealed = get_aead().encrypt(nonce, token.encode(), None)
+    return base64.urlsafe_b64encode(AESGCM_TOKEN_VERSION + nonce + sealed).decode()
 
 def decrypt_token(encrypted_token: str) -> str:
+    if encrypted_token.startswith(AESGCM_TOKEN_PREFIX):
+        raw = base64.urlsafe_b64decode(encrypted_token)
+        nonce, sealed = raw[1:1 + AESGCM_NONCE_SIZE], raw[1 + AESGCM_NONCE_SIZE:]
+        return get_aead().decrypt(nonce, sealed, None).decode()
+
     cipher = get_cipher()
-    encrypted_bytes = base64.b64decode(encrypted_token.encode())
+    encrypted_bytes = encrypted_token.encode()
+    if not encrypted_token.startswith(FERNET_TOKEN_PREFIX):
+        # Tokens stored before the change were base64-encoded a second time
+        encrypted_bytes = base64.b64decode(encrypted_bytes)
     decrypted = cipher.decrypt(encrypted_bytes)
     return decrypted.decode()
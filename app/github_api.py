@@ -1,12 +1,53 @@
 import asyncio
+import contextlib
+import time
+from collections import OrderedDict
 import aiohttp
 import logging
-from typing import List, Dict, Optional, Tuple
+from typing import Any, List, Dict, Optional, Tuple
 from app.config import Config
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 logger = logging.getLogger(__name__)
 
+# Returned by _fetch_repo_page when the page still matches the ETag sent
+NOT_MODIFIED = object()
+
+class RateLimitError(Exception):
+    """GitHub kept rate limiting a request past the retry budget"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = max(retry_after, 0.0)
+        super().__init__(f"GitHub rate limit exceeded, retry in {self.retry_after:.0f}s")
+
 class GitHubAPI:
+    # One keep-alive session shared by every client, so repeated calls to
+    # api.github.com reuse TCP/TLS connections instead of reconnecting
+    _session: Optional[aiohttp.ClientSession] = None
+
+    # Pause once fewer than RATE_LIMIT_THRESHOLD calls remain in the current
+    # rate-limit window, but never stall a request longer than MAX_RATE_LIMIT_WAIT
+    RATE_LIMIT_THRESHOLD = 10
+    MAX_RATE_LIMIT_WAIT = 60
+
+    # Rate-limited responses (403/429) are retried up to MAX_RETRIES times.
+    # In-flight requests are capped across all clients, with a much tighter cap
+    # for mutating calls since GitHub's secondary rate limit fires on write bursts
+    MAX_RETRIES = 3
+    MAX_CONCURRENT_READS = 8
+    MAX_CONCURRENT_WRITES = 2
+    _read_semaphore = asyncio.Semaphore(MAX_CONCURRENT_READS)
+    _write_semaphore = asyncio.Semaphore(MAX_CONCURRENT_WRITES)
+
+    # get_repository answers are reused for REPO_CACHE_TTL seconds, then revalidated
+    # with a conditional request; at most REPO_CACHE_SIZE repositories are kept
+    REPO_CACHE_TTL = 30
+    REPO_CACHE_SIZE = 256
+
     def __init__(self, token: str, username: str = ""):
         self.token = token
         self.username = username
@@ -16,140 +57,304 @@ class GitHubAPI:
             'Accept': 'application/vnd.github.v3+json',
             'User-Agent': 'GitHub-Visibility-Bot/1.0'
         }
+        # Epoch time until which requests should wait for the rate limit to reset
+        self._pause_until = 0.0
+        # get_repository results: (owner, repo) -> (fetched_at, etag, repo), oldest first
+        self._repo_cache: OrderedDict[Tuple[str, str], Tuple[float, Optional[str], Dict]] = OrderedDict()
+        self._repo_inflight: Dict[Tuple[str, str], asyncio.Future] = {}
         logger.debug(f"GitHubAPI initialized for user: {username}")
 
+    @classmethod
+    async def _get_session(cls) -> aiohttp.ClientSession:
+        """Get the shared HTTP session, creating it on first use"""
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=64, ttl_dns_cache=300, keepalive_timeout=75)
+            )
+        return cls._session
+
+    @classmethod
+    async def close(cls):
+        """Close the shared HTTP session"""
+        if cls._session is not None and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+
+    def _track_rate_limit(self, response: aiohttp.ClientResponse):
+        """Record when to back off, based on GitHub's rate-limit headers"""
+        try:
+            remaining = int(response.headers['X-RateLimit-Remaining'])
+            reset = int(response.headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+
+        if remaining < self.RATE_LIMIT_THRESHOLD:
+            self._pause_until = max(self._pause_until, reset)
+
+    async def _wait_for_rate_limit(self):
+        """Sleep until the rate-limit window resets if we are close to the limit"""
+        delay = self._pause_until - time.time()
+        if delay > 0:
+            delay = min(delay, self.MAX_RATE_LIMIT_WAIT)
+            logger.warning(f"⏳ GitHub rate limit nearly exhausted, waiting {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retry_delay(response: aiohttp.ClientResponse, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying a rate-limited response, or None if it was not"""
+        if response.status not in (403, 429):
+            return None
+
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+            try:
+                return max(int(response.headers['X-RateLimit-Reset']) - time.time(), 0.0)
+            except (KeyError, ValueError):
+                pass
+
+        # 429 without hints: exponential backoff. A bare 403 is a permission error.
+        return float(2 ** attempt) if response.status == 429 else None
+
+    @contextlib.asynccontextmanager
+    async def _request(self, method: str, url: str, **kwargs):
+        """Send a request under the shared concurrency limits, retrying while rate limited"""
+        session = await self._get_session()
+        semaphore = self._read_semaphore if method == 'GET' else self._write_semaphore
+        headers = self.headers
+        if kwargs.get('headers'):
+            headers = {**headers, **kwargs['headers']}
+        kwargs.pop('headers', None)
+        attempt = 0
+        while True:
+            await self._wait_for_rate_limit()
+            async with semaphore:
+                async with session.request(method, url, headers=headers, **kwargs) as response:
+                    self._track_rate_limit(response)
+                    delay = self._retry_delay(response, attempt)
+                    if delay is None:
+                        yield response
+                        return
+
+            if attempt >= self.MAX_RETRIES or delay > self.MAX_RATE_LIMIT_WAIT:
+                raise RateLimitError(delay)
+            attempt += 1
+            logger.warning(f"⏳ GitHub rate limited {method} {url}, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
     async def validate_token(self) -> Tuple[bool, str]:
         """Validate GitHub token and get user info"""
         try:
             logger.info("🔍 Validating GitHub token...")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f'{self.base_url}/user', headers=self.headers) as response:
-                    if response.status == 200:
-                        user_data = await response.json()
-                        username = user_data.get('login', 'Unknown')
-                        logger.info(f"✅ Token valid for user: {username}")
-                        return True, username
-                    else:
-                        error_data = await response.json()
-                        error_msg = error_data.get('message', f'HTTP {response.status}')
-                        logger.error(f"❌ Token validation failed: {error_msg}")
-                        return False, error_msg
+            async with self._request('GET', f'{self.base_url}/user') as response:
+                if response.status == 200:
+                    user_data = json_loads(await response.read())
+                    username = user_data.get('login', 'Unknown')
+                    logger.info(f"✅ Token valid for user: {username}")
+                    return True, username
+                else:
+                    error_data = json_loads(await response.read())
+                    error_msg = error_data.get('message', f'HTTP {response.status}')
+                    logger.error(f"❌ Token validation failed: {error_msg}")
+                    return False, error_msg
 
         except Exception as e:
             logger.error(f"❌ Error validating token: {e}")
             return False, str(e)
 
+    @staticmethod
+    def _summarize_repo(repo: Dict) -> Dict:
+        """Keep only the repository fields the bot uses"""
+        return {
+            'name': repo['name'],
+            'full_name': repo['full_name'],
+            'private': repo['private'],
+            'owner': repo['owner']['login'],
+            'description': repo.get('description', ''),
+            'url': repo['html_url'],
+            'created_at': repo['created_at'],
+            'updated_at': repo['updated_at'],
+            'size': repo['size'],
+            'language': repo.get('language', 'Unknown')
+        }
+
+    async def _fetch_repo_page(self, page: int, per_page: int, etag: Optional[str] = None) -> Tuple[Any, int, Optional[str]]:
+        """Fetch one page of repositories, returning it, the last page number and its ETag
+
+        The page is None on error, or NOT_MODIFIED if it still matches ``etag``.
+        """
+        url = f'{self.base_url}/user/repos?page={page}&per_page={per_page}&type=all&sort=updated'
+        logger.debug(f"Fetching page {page}...")
+
+        headers = {'If-None-Match': etag} if etag else None
+        async with self._request('GET', url, headers=headers) as response:
+            if response.status == 304:
+                return NOT_MODIFIED, page, etag
+            if response.status != 200:
+                logger.error(f"Failed to fetch repos page {page}: HTTP {response.status}")
+                return None, page, None
+
+            # Parsed with orjson when available, like every GitHub response
+            repos = json_loads(await response.read())
+
+            # GitHub advertises the final page in the Link header
+            last_page = page
+            last_link = response.links.get('last')
+            if last_link:
+                try:
+                    last_page = int(last_link['url'].query['page'])
+                except (KeyError, ValueError):
+                    pass
+
+            return repos, last_page, response.headers.get('ETag')
+
     async def list_repositories(self) -> List[Dict]:
         """List all repositories for the authenticated user"""
+        repositories, _ = await self.list_repositories_if_changed(None)
+        return repositories or []
+
+    async def list_repositories_if_changed(self, etag: Optional[str]) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """List repositories unless the listing still matches ``etag``
+
+        Returns ``(None, etag)`` when unchanged. An ETag is only returned for
+        single-page listings, where the first page covers every repository.
+        """
         try:
             logger.info("📋 Fetching repositories...")
-            repositories = []
-            page = 1
             per_page = 100
 
-            async with aiohttp.ClientSession() as session:
-                while True:
-                    url = f'{self.base_url}/user/repos?page={page}&per_page={per_page}&type=all&sort=updated'
-                    logger.debug(f"Fetching page {page}...")
-
-                    async with session.get(url, headers=self.headers) as response:
-                        if response.status != 200:
-                            logger.error(f"Failed to fetch repos: HTTP {response.status}")
-                            break
-
-                        repos = await response.json()
-                        if not repos:
-                            break
-
-                        for repo in repos:
-                            repositories.append({
-                                'name': repo['name'],
-                                'full_name': repo['full_name'],
-                                'private': repo['private'],
-                                'owner': repo['owner']['login'],
-                                'description': repo.get('description', ''),
-                                'url': repo['html_url'],
-                                'created_at': repo['created_at'],
-                                'updated_at': repo['updated_at'],
-                                'size': repo['size'],
-                                'language': repo.get('language', 'Unknown')
-                            })
-
-                        page += 1
-                        if len(repos) < per_page:
-                            break
-
-                        # Small delay to avoid rate limiting
-                        await asyncio.sleep(0.1)
+            first_page, last_page, first_etag = await self._fetch_repo_page(1, per_page, etag)
+            if first_page is NOT_MODIFIED:
+                logger.info("✅ Repositories unchanged since last listing")
+                return None, etag
+            if not first_page:
+                return [], None
+
+            pages = [first_page]
+            if last_page > 1:
+                # Fetch the remaining pages concurrently
+                semaphore = asyncio.Semaphore(5)
+
+                async def fetch_page(page: int) -> List[Dict]:
+                    async with semaphore:
+                        repos, _, _ = await self._fetch_repo_page(page, per_page)
+                        return repos or []
+
+                pages.extend(await asyncio.gather(*(fetch_page(page) for page in range(2, last_page + 1))))
+
+            repositories = [self._summarize_repo(repo) for repos in pages for repo in repos]
 
             logger.info(f"✅ Found {len(repositories)} repositories")
-            return repositories
+            return repositories, first_etag if last_page == 1 else None
 
+        except RateLimitError:
+            raise
         except Exception as e:
             logger.error(f"❌ Error listing repositories: {e}")
-            return []
+            return [], None
 
     async def get_repository(self, owner: str, repo_name: str) -> Optional[Dict]:
         """Get specific repository information"""
+        key = (owner, repo_name)
+        entry = self._repo_cache.get(key)
+        if entry and time.monotonic() - entry[0] < self.REPO_CACHE_TTL:
+            self._repo_cache.move_to_end(key)
+            return dict(entry[2])
+
+        # Concurrent lookups of the same repository share one request
+        task = self._repo_inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_repository(owner, repo_name))
+            self._repo_inflight[key] = task
+            task.add_done_callback(lambda _: self._repo_inflight.pop(key, None))
+
+        repo = await asyncio.shield(task)
+        return dict(repo) if repo else None
+
+    async def _fetch_repository(self, owner: str, repo_name: str) -> Optional[Dict]:
+        """Fetch a repository, revalidating any cached copy with its ETag"""
+        key = (owner, repo_name)
+        entry = self._repo_cache.get(key)
         try:
             logger.info(f"🔍 Getting repository: {owner}/{repo_name}")
 
-            async with aiohttp.ClientSession() as session:
-                url = f'{self.base_url}/repos/{owner}/{repo_name}'
-                async with session.get(url, headers=self.headers) as response:
-                    if response.status == 200:
-                        repo_data = await response.json()
-                        logger.info(f"✅ Repository found: {repo_data['full_name']}")
-                        return {
-                            'name': repo_data['name'],
-                            'full_name': repo_data['full_name'],
-                            'private': repo_data['private'],
-                            'owner': repo_data['owner']['login'],
-                            'description': repo_data.get('description', ''),
-                            'url': repo_data['html_url'],
-                            'created_at': repo_data['created_at'],
-                            'updated_at': repo_data['updated_at'],
-                            'size': repo_data['size'],
-                            'language': repo_data.get('language', 'Unknown')
-                        }
-                    elif response.status == 404:
-                        logger.warning(f"Repository not found: {owner}/{repo_name}")
-                        return None
-                    else:
-                        error_data = await response.json()
-                        logger.error(f"Error getting repo: {error_data}")
-                        return None
+            url = f'{self.base_url}/repos/{owner}/{repo_name}'
+            headers = {'If-None-Match': entry[1]} if entry and entry[1] else None
+            async with self._request('GET', url, headers=headers) as response:
+                if response.status == 304 and entry:
+                    # Unchanged; 304s do not count against the rate limit
+                    self._cache_repo(key, entry[1], entry[2])
+                    return entry[2]
+                elif response.status == 200:
+                    repo_data = json_loads(await response.read())
+                    logger.info(f"✅ Repository found: {repo_data['full_name']}")
+                    repo = self._summarize_repo(repo_data)
+                    self._cache_repo(key, response.headers.get('ETag'), repo)
+                    return repo
+                elif response.status == 404:
+                    logger.warning(f"Repository not found: {owner}/{repo_name}")
+                    self._repo_cache.pop(key, None)
+                    return None
+                else:
+                    error_data = json_loads(await response.read())
+                    logger.error(f"Error getting repo: {error_data}")
+                    return None
 
+        except RateLimitError:
+            raise
         except Exception as e:
             logger.error(f"❌ Error getting repository: {e}")
             return None
 
+    def _cache_repo(self, key: Tuple[str, str], etag: Optional[str], repo: Dict):
+        """Store a repository in the LRU cache, evicting the oldest entry when full"""
+        self._repo_cache[key] = (time.monotonic(), etag, repo)
+        self._repo_cache.move_to_end(key)
+        if len(self._repo_cache) > self.REPO_CACHE_SIZE:
+            self._repo_cache.popitem(last=False)
+
     async def toggle_repository_visibility(self, owner: str, repo_name: str, make_private: bool) -> Tuple[bool, str]:
         """Toggle repository visibility"""
         try:
             visibility = "private" if make_private else "public"
             logger.info(f"🔄 Making {owner}/{repo_name} {visibility}...")
 
-            async with aiohttp.ClientSession() as session:
-                url = f'{self.base_url}/repos/{owner}/{repo_name}'
-                data = {'private': make_private}
-
-                async with session.patch(url, headers=self.headers, json=data) as response:
-                    if response.status == 200:
-                        message = f"Repository {repo_name} is now {visibility}"
-                        logger.info(f"✅ {message}")
-                        return True, message
-                    else:
-                        try:
-                            error_data = await response.json()
-                            error_msg = error_data.get('message', f'HTTP {response.status}')
-                        except:
-                            error_msg = f'HTTP {response.status}'
+            url = f'{self.base_url}/repos/{owner}/{repo_name}'
+            data = {'private': make_private}
+
+            async with self._request('PATCH', url, json=data) as response:
+                if response.status == 200:
+                    # The cached copy has the old visibility
+                    self._repo_cache.pop((owner, repo_name), None)
 
+                    # Trust the state GitHub reports back, not the one requested
+                    repo_data = json_loads(await response.read())
+                    if repo_data.get('private') != make_private:
+                        error_msg = f"Repository {repo_name} is still {'private' if repo_data.get('private') else 'public'}"
                         logger.error(f"❌ Failed to toggle visibility: {error_msg}")
                         return False, error_msg
 
+                    message = f"Repository {repo_name} is now {visibility}"
+                    logger.info(f"✅ {message}")
+                    return True, message
+                else:
+                    try:
+                        error_data = json_loads(await response.read())
+                        error_msg = error_data.get('message', f'HTTP {response.status}')
+                    except:
+                        error_msg = f'HTTP {response.status}'
+
+                    logger.error(f"❌ Failed to toggle visibility: {error_msg}")
+                    return False, error_msg
+
+        except RateLimitError:
+            raise
         except Exception as e:
             logger.error(f"❌ Error toggling repository visibility: {e}")
             return False, str(e)
@@ -158,13 +363,12 @@ class GitHubAPI:
         """Batch toggle repository visibility"""
         logger.info(f"🔄 Batch toggling {len(repos)} repositories...")
         results = {}
-        semaphore = asyncio.Semaphore(3)  # Limit concurrent requests
+        semaphore = asyncio.Semaphore(10)  # Limit concurrent requests; pacing follows rate-limit headers
 
         async def toggle_single(owner: str, repo_name: str):
             async with semaphore:
                 success, message = await self.toggle_repository_visibility(owner, repo_name, make_private)
                 results[f"{owner}/{repo_name}"] = (success, message)
-                await asyncio.sleep(0.2)  # Rate limiting
 
         tasks = [toggle_single(owner, repo_name) for owner, repo_name in repos]
         await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,91 +1,146 @@
 import asyncio
+import contextlib
+import functools
 import logging
-import traceback
+import re
+import time
+from html import escape
+from typing import Dict, List, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from app.config import Config
 from app.database import Database
-from app.github_api import GitHubAPI
-from app.utils import format_repository_list, format_logs, parse_repository_list
+from app.github_api import GitHubAPI, RateLimitError
+from app.utils import format_repository_list, format_logs, parse_repository_list, chunk_html
 
 logger = logging.getLogger(__name__)
 
-class BotHandlers:
-    def __init__(self):
-        logger.info("Initializing BotHandlers...")
-        try:
-            self.db = Database()
-            logger.info("✅ BotHandlers initialized successfully")
-            logger.info(f"🔧 Admin configuration: {len(Config.ADMIN_USER_IDS)} admin(s) configured")
-            logger.info(f"🔧 Admin IDs: {Config.ADMIN_USER_IDS}")
-        except Exception as e:
-            logger.error(f"❌ Failed to initialize BotHandlers: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            raise
-
-    def _rate_limit_check(self, user_id: int) -> bool:
-        return True
-
-    def _is_authorized(self, user_id: int) -> bool:
-        """Check if user is authorized (admin or database authorized)"""
-        # First check if user is hardcoded admin
-        if Config.is_admin(user_id):
-            return True
-
-        # Then check database authorization (for future expansion)
-        # This allows admins to authorize other users via database
-        return False
-
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /start command with enhanced formatting"""
-        try:
-            user_id = update.effective_user.id
-            username = update.effective_user.username or f"user_{user_id}"
-
-            logger.info(f"📍 Processing /start command from user {user_id} ({username})")
-            logger.info(f"🔍 User admin status: {Config.is_admin(user_id)}")
-
-            # Create or get user
-            user = await self.db.get_user(user_id)
-            if not user:
-                logger.info(f"🆕 Creating new user: {user_id}")
-                success = await self.db.create_user(user_id, username)
-                if success:
-                    user = await self.db.get_user(user_id)
-                else:
-                    await update.message.reply_text(
-                        "❌ <b>Registration Failed</b>\n"
-                        "Could not register your account. Please try again.",
-                        parse_mode='HTML'
-                    )
-                    return
-
-            # Check authorization (hardcoded admin or database authorized)
-            is_authorized = self._is_authorized(user_id) or (user and user.get('is_authorized', False))
-
-            if is_authorized:
-                # Get user's current status
-                apis = await self.db.get_user_apis(user_id)
-                active_api = await self.db.get_active_api(user_id)
-                recent_logs = await self.db.get_user_logs(user_id, 5)
-
-                # Build admin status info
-                admin_status = ""
-                if Config.is_admin(user_id):
-                    admin_status = "\n🔱 <b>Admin Status:</b> You have administrator privileges"
-
-                # Build API status info
-                api_status = ""
-                if apis:
-                    api_count = len(apis)
-                    if active_api:
-                        api_status = f"\n<b>📊 Your Status:</b>\n• GitHub APIs: {api_count} (Active: <code>{active_api['api_name']}</code>)\n• Recent actions: {len(recent_logs)}"
-                    else:
-                        api_status = f"\n<b>📊 Your Status:</b>\n• GitHub APIs: {api_count} (None active)\n• Use <code>/load_api &lt;name&gt;</code> to activate one"
-                else:
-                    api_status = f"\n<b>📊 Your Status:</b>\n• No GitHub APIs added yet\n• Start with <code>/add_api personal YOUR_TOKEN</code>"
-
-                welcome_text = f"""
+# Replies shared by several commands
+_ACCESS_DENIED_HTML = (
+    "❌ <b>Access Denied</b>\n"
+    "You are not authorized to use this command."
+)
+
+_ADMIN_REQUIRED_TMPL = (
+    "❌ <b>Admin Access Required</b>\n"
+    "This command requires administrator privileges.\n\n"
+    "Your User ID: <code>{user_id}</code>"
+)
+
+# error_handler's reply; error is the escaped, truncated exception text
+_ERROR_TMPL = "❌ <b>Error</b>: <code>{error}</code>"
+
+_NO_ACTIVE_API_HTML = (
+    "❌ <b>No Active API</b>\n\n"
+    "Please load a GitHub API first:\n"
+    "1. <code>/list_apis</code> - See your APIs\n"
+    "2. <code>/load_api &lt;name&gt;</code> - Load an API\n"
+    "3. Or <code>/add_api &lt;name&gt; &lt;token&gt;</code> - Add new API"
+)
+
+# Most repositories one /batch_toggle may name, and how many are processed at once
+_MAX_BATCH_REPOS = 10
+_BATCH_CONCURRENCY = 5
+
+# Unconfirmed /batch_toggle requests kept per user; the oldest is dropped first
+_MAX_PENDING_BATCHES = 10
+
+# Seconds between /batch_toggle progress edits, kept well under Telegram's edit rate limit
+_PROGRESS_INTERVAL = 1.0
+
+# Repository listings longer than this are formatted on a worker thread so the event loop stays responsive
+_FORMAT_IN_THREAD_THRESHOLD = 200
+
+_RATE_LIMITED_HTML = (
+    "⏳ <b>GitHub Rate Limit Reached</b>\n\n"
+    "GitHub is throttling requests for this token.\n"
+    "Please try again in about {retry_after:.0f}s."
+)
+
+_LIST_APIS_FOOTER_HTML = (
+    "<b>💡 Commands:</b>\n"
+    "• <code>/load_api &lt;name&gt;</code> - Switch to API\n"
+    "• <code>/remove_api &lt;name&gt;</code> - Remove API\n"
+    "• <code>/current_api</code> - Show active API"
+)
+
+_REPO_STATUS_TMPL = (
+    "📊 <b>Repository Status</b>\n\n"
+    "<b>Name:</b> <code>{name}</code>\n"
+    "<b>Owner:</b> <code>{owner}</code>\n"
+    "<b>Full Name:</b> <code>{full_name}</code>\n"
+    "<b>Visibility:</b> {visibility}\n"
+    "<b>Language:</b> {language}\n"
+    "<b>Size:</b> {size_mb} MB\n"
+    "<b>Description:</b> {description}\n\n"
+    "<b>🔗 Links:</b>\n"
+    "<a href='{url}'>View on GitHub</a>\n\n"
+    "<b>📅 Dates:</b>\n"
+    "• Created: {created_date}\n"
+    "• Updated: {updated_date}"
+)
+
+_BATCH_HEADER_TMPL = (
+    "📊 <b>Batch Operation Results</b>\n\n"
+    "<b>Action:</b> {action}\n"
+    "<b>Success:</b> {success_count}/{total}\n\n"
+)
+_BATCH_LINE_OK_TMPL = "✅ <code>{repo}</code> → <b>{visibility}</b>\n"
+_BATCH_LINE_FAILED_TMPL = "❌ <code>{repo}</code> - {message}{more}\n"
+
+# Usage replies for commands that take a fixed number of arguments, keyed by handler name
+_USAGE_HTML = {
+    'add_api_command': (
+        "❌ <b>Invalid Usage</b>\n"
+        "Usage: <code>/add_api &lt;api_name&gt; &lt;github_token&gt;</code>\n\n"
+        "Example: <code>/add_api personal ghp_xxxxxxxxxxxx</code>"
+    ),
+    'load_api_command': (
+        "❌ <b>Invalid Usage</b>\n"
+        "Usage: <code>/load_api &lt;api_name&gt;</code>\n\n"
+        "💡 Use <code>/list_apis</code> to see available APIs"
+    ),
+    'remove_api_command': (
+        "❌ <b>Invalid Usage</b>\n"
+        "Usage: <code>/remove_api &lt;api_name&gt;</code>\n\n"
+        "💡 Use <code>/list_apis</code> to see your APIs"
+    ),
+    'make_public_command': (
+        "❌ <b>Invalid Usage</b>\n\n"
+        "Usage: <code>/public &lt;repository_name&gt;</code>\n\n"
+        "Examples:\n"
+        "• <code>/public my-repo</code>\n"
+        "• <code>/public username/my-repo</code>\n\n"
+        "💡 Use <code>/list_repos</code> to see your repositories"
+    ),
+    'make_private_command': (
+        "❌ <b>Invalid Usage</b>\n\n"
+        "Usage: <code>/private &lt;repository_name&gt;</code>\n\n"
+        "Examples:\n"
+        "• <code>/private my-repo</code>\n"
+        "• <code>/private username/my-repo</code>\n\n"
+        "💡 Use <code>/list_repos</code> to see your repositories"
+    ),
+    'repo_status_command': (
+        "❌ <b>Invalid Usage</b>\n\n"
+        "Usage: <code>/repo_status &lt;repository_name&gt;</code>\n\n"
+        "Examples:\n"
+        "• <code>/repo_status my-repo</code>\n"
+        "• <code>/repo_status username/my-repo</code>"
+    ),
+    'authorize_command': (
+        "❌ <b>Invalid Usage</b>\n"
+        "Usage: <code>/authorize &lt;user_id&gt;</code>"
+    ),
+    'revoke_command': (
+        "❌ <b>Invalid Usage</b>\n"
+        "Usage: <code>/revoke &lt;user_id&gt;</code>"
+    ),
+}
+
+# /start reply skeletons, filled in with str.format
+_WELCOME_AUTHORIZED_TMPL = """
 🚀 <b>Welcome back, {username}!</b>
 
 You are authorized to use this bot.{admin_status}{api_status}
@@ -112,9 +167,9 @@ You are authorized to use this bot.{admin_status}{api_status}
 2. <code>/load_api personal</code>
 3. <code>/list_repos</code>
 4. <code>/private repo-name</code> or <code>/public repo-name</code>
-                """
-            else:
-                welcome_text = f"""
+"""
+
+_WELCOME_UNAUTHORIZED_TMPL = """
 👋 <b>Hello, {username}!</b>
 
 You have been registered but are not yet authorized.
@@ -133,1089 +188,996 @@ Please contact an administrator to get access.
 <b>ℹ️ Available Commands:</b>
 • <code>/help</code> - Show help information
 • <code>/start</code> - Refresh your status
-                """
-
-            await update.message.reply_text(welcome_text, parse_mode='HTML')
-            logger.info(f"✅ Successfully processed /start for user {user_id}")
+"""
 
-        except Exception as e:
-            logger.error(f"❌ Error in start_command: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            await update.message.reply_text(
-                f"❌ <b>Error in Start Command</b>\n"
-                f"Error: <code>{str(e)[:200]}</code>\n\n"
-                f"Please contact support.",
-                parse_mode='HTML'
-            )
+_HELP_HTML = """
+🤖 <b>GitHub Repository Visibility Bot</b>
 
-    async def add_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /add_api command - Now with real GitHub integration"""
-        try:
-            user_id = update.effective_user.id
+<b>🔑 GitHub API Management:</b>
+• <code>/add_api &lt;name&gt; &lt;token&gt;</code> - Add new GitHub API credentials
+• <code>/list_apis</code> - Show all your GitHub APIs
+• <code>/load_api &lt;name&gt;</code> - Switch to specific GitHub API
+• <code>/current_api</code> - Show currently active API
+• <code>/remove_api &lt;name&gt;</code> - Remove GitHub API credentials
 
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+<b>📁 Repository Management:</b>
+• <code>/list_repos</code> - List all repositories from current API
+• <code>/public &lt;repo_name&gt;</code> - Make repository public
+• <code>/private &lt;repo_name&gt;</code> - Make repository private
+• <code>/repo_status &lt;repo_name&gt;</code> - Check current repository visibility
+• <code>/batch_toggle &lt;repos&gt;</code> - Batch toggle multiple repositories
 
-            if len(context.args) != 2:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n"
-                    "Usage: <code>/add_api &lt;api_name&gt; &lt;github_token&gt;</code>\n\n"
-                    "Example: <code>/add_api personal ghp_xxxxxxxxxxxx</code>",
-                    parse_mode='HTML'
-                )
-                return
+<b>📊 Activity &amp; Logs:</b>
+• <code>/logs</code> - Show recent activity logs
 
-            api_name, github_token = context.args
+<b>👤 Admin Commands:</b>
+• <code>/authorize &lt;user_id&gt;</code> - Authorize user access
+• <code>/revoke &lt;user_id&gt;</code> - Revoke user access
 
-            # Show processing message
-            processing_msg = await update.message.reply_text("🔍 <b>Validating GitHub token...</b>", parse_mode='HTML')
+<b>ℹ️ General:</b>
+• <code>/start</code> - Initialize and check your status
+• <code>/help</code> - Show this help message
 
-            # Validate GitHub token
-            github_api = GitHubAPI(github_token, "")
-            is_valid, result = await github_api.validate_token()
+<b>💡 Tips:</b>
+- Repository names can include owner: <code>owner/repo</code> or just <code>repo</code>
+- All operations are logged for audit purposes
+- Your GitHub tokens are encrypted and stored securely
 
-            if not is_valid:
-                await processing_msg.edit_text(
-                    f"❌ <b>Invalid GitHub Token</b>\n"
-                    f"Error: <code>{result}</code>\n\n"
-                    f"Please check your token and try again.",
-                    parse_mode='HTML'
-                )
-                return
+<b>🔒 Security:</b>
+- GitHub tokens are encrypted before storage
+- All actions are logged for audit purposes
+- Access control prevents unauthorized usage
 
-            github_username = result
+<b>🚀 Getting Started:</b>
+1. Add your GitHub token: <code>/add_api personal YOUR_TOKEN</code>
+2. Load the API: <code>/load_api personal</code>
+3. List your repos: <code>/list_repos</code>
+4. Manage visibility: <code>/public repo-name</code> or <code>/private repo-name</code>
+"""
 
-            # Add API to database
-            success = await self.db.add_github_api(user_id, api_name, github_token, github_username)
+# /help without markup, sent if Telegram rejects the HTML version
+_HELP_PLAIN = re.sub(r"</?(?:b|code)>", "", _HELP_HTML)
 
-            if success:
-                await processing_msg.edit_text(
-                    f"✅ <b>GitHub API Added Successfully</b>\n\n"
-                    f"<b>API Name:</b> <code>{api_name}</code>\n"
-                    f"<b>GitHub Username:</b> <code>{github_username}</code>\n"
-                    f"<b>Status:</b> Ready to use\n\n"
-                    f"💡 Use <code>/load_api {api_name}</code> to activate it\n"
-                    f"💡 Use <code>/list_repos</code> to see your repositories",
-                    parse_mode='HTML'
-                )
+def _split(text: str, size: int = 4000):
+    """Yield consecutive slices of text that fit in one Telegram message"""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
 
-                # Log action
-                await self.db.log_action(user_id, "add_api", api_name, "success")
-                logger.info(f"✅ Successfully added API '{api_name}' for user {user_id}")
-            else:
-                await processing_msg.edit_text(
-                    "❌ <b>Failed to Add API</b>\n"
-                    "Database error occurred. Please try again.",
-                    parse_mode='HTML'
-                )
+def requires(auth: bool = True, args: Optional[int] = None, admin: bool = False, active_api: bool = False):
+    """Run the shared access, usage and active API checks before the handler
 
-        except Exception as e:
-            logger.error(f"❌ Error in add_api_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+    With active_api=True the user's active API is looked up once and passed to
+    the handler as an extra argument.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+            user_id = update.effective_user.id
+            if admin and not Config.is_admin(user_id):
+                await update.message.reply_text(_ADMIN_REQUIRED_TMPL.format(user_id=user_id), parse_mode='HTML')
+                return
+            if auth and not self._is_authorized(user_id):
+                await self._deny(update)
+                return
+            if args is not None and len(context.args) != args:
+                await update.message.reply_text(_USAGE_HTML[func.__name__], parse_mode='HTML')
+                return
+            if active_api:
+                api = await self.db.get_active_api(user_id)
+                if not api:
+                    await update.message.reply_text(_NO_ACTIVE_API_HTML, parse_mode='HTML')
+                    return
+                return await func(self, update, context, api)
+            return await func(self, update, context)
+        return wrapper
+    return decorator
 
-    async def list_apis_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /list_apis command - Now with real data"""
+class BotHandlers:
+    def __init__(self):
+        logger.info("Initializing BotHandlers...")
         try:
-            user_id = update.effective_user.id
+            self.db = Database()
 
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+            # GitHub clients per (user_id, api_name); they share one HTTP session
+            # and keep their rate-limit state between commands
+            self._gh_clients: Dict[Tuple[int, str], GitHubAPI] = {}
 
-            apis = await self.db.get_user_apis(user_id)
+            # Last formatted /list_repos reply and its ETag per (user_id, api_name)
+            self._repo_list_cache: Dict[Tuple[int, str], Tuple[str, str]] = {}
 
-            if not apis:
-                await update.message.reply_text(
-                    "📋 <b>No GitHub APIs Found</b>\n\n"
-                    "You haven't added any GitHub APIs yet.\n\n"
-                    "💡 Use <code>/add_api &lt;name&gt; &lt;token&gt;</code> to add one\n"
-                    "💡 Example: <code>/add_api personal ghp_xxxxxxxxxxxx</code>",
-                    parse_mode='HTML'
-                )
-                return
+            # button_callback handlers, keyed by the callback_data prefix
+            self._callbacks = {
+                "cancel": self._cb_cancel,
+                "remove_api": self._cb_remove_api,
+                "batch_confirm": self._cb_batch_confirm,
+            }
 
-            api_list = "📋 <b>Your GitHub APIs:</b>\n\n"
-            for api in apis:
-                status = "🟢 <b>Active</b>" if api['is_active'] else "⚪ Inactive"
-                created_date = api['created_at'][:10]
-                api_list += f"• <b>{api['api_name']}</b> ({status})\n"
-                api_list += f"  👤 Username: <code>{api['github_username']}</code>\n"
-                api_list += f"  📅 Added: {created_date}\n\n"
+            logger.info("✅ BotHandlers initialized successfully")
+            admin_ids = Config.ADMIN_USER_IDS
+            logger.info("🔧 Admin configuration: %s admin(s) configured", len(admin_ids))
+            logger.info("🔧 Admin IDs: %s", admin_ids)
+        except Exception as e:
+            logger.exception("❌ Failed to initialize BotHandlers: %s", e)
+            raise
 
-            api_list += "<b>💡 Commands:</b>\n"
-            api_list += "• <code>/load_api &lt;name&gt;</code> - Switch to API\n"
-            api_list += "• <code>/remove_api &lt;name&gt;</code> - Remove API\n"
-            api_list += "• <code>/current_api</code> - Show active API"
+    def _github_for(self, active_api: Dict) -> GitHubAPI:
+        """Get the cached GitHub client for an API row"""
+        key = (active_api['user_id'], active_api['api_name'])
+        github_api = self._gh_clients.get(key)
+        if github_api is None or github_api.token != active_api['github_token']:
+            github_api = GitHubAPI(active_api['github_token'], active_api['github_username'])
+            self._gh_clients[key] = github_api
+        return github_api
 
-            await update.message.reply_text(api_list, parse_mode='HTML')
+    def _invalidate(self, user_id: int):
+        """Drop the user's cached GitHub clients and replies after their APIs change"""
+        for key in [key for key in self._gh_clients if key[0] == user_id]:
+            del self._gh_clients[key]
+        for key in [key for key in self._repo_list_cache if key[0] == user_id]:
+            del self._repo_list_cache[key]
 
-        except Exception as e:
-            logger.error(f"❌ Error in list_apis_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+    async def _deny(self, update: Update):
+        """Tell an unauthorized user they cannot use the command"""
+        await update.message.reply_text(_ACCESS_DENIED_HTML, parse_mode='HTML')
 
-    async def load_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /load_api command - Now with real switching"""
-        try:
-            user_id = update.effective_user.id
+    def _rate_limit_check(self, user_id: int) -> bool:
+        return True
 
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+    def _is_authorized(self, user_id: int) -> bool:
+        """Check if user is authorized (admin or database authorized)"""
+        # First check if user is hardcoded admin
+        if Config.is_admin(user_id):
+            return True
 
-            if len(context.args) != 1:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n"
-                    "Usage: <code>/load_api &lt;api_name&gt;</code>\n\n"
-                    "💡 Use <code>/list_apis</code> to see available APIs",
-                    parse_mode='HTML'
-                )
-                return
+        # Then check database authorization (for future expansion)
+        # This allows admins to authorize other users via database
+        return False
 
-            api_name = context.args[0]
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /start command with enhanced formatting"""
+        try:
+            user_id = update.effective_user.id
+            username = update.effective_user.username or f"user_{user_id}"
 
-            # Check if API exists
-            apis = await self.db.get_user_apis(user_id)
-            api_exists = any(api['api_name'] == api_name for api in apis)
+            logger.info("📍 Processing /start command from user %s (%s)", user_id, username)
+            is_admin = Config.is_admin(user_id)
+            logger.info("🔍 User admin status: %s", is_admin)
 
-            if not api_exists:
-                available_apis = [api['api_name'] for api in apis]
+            # Create or refresh user in one round-trip
+            user = await self.db.upsert_user(user_id, username)
+            if not user:
                 await update.message.reply_text(
-                    f"❌ <b>API Not Found</b>\n\n"
-                    f"API <code>{api_name}</code> doesn't exist.\n\n"
-                    f"<b>Available APIs:</b> {', '.join(available_apis) if available_apis else 'None'}\n\n"
-                    f"💡 Use <code>/list_apis</code> to see all your APIs",
+                    "❌ <b>Registration Failed</b>\n"
+                    "Could not register your account. Please try again.",
                     parse_mode='HTML'
                 )
                 return
 
-            success = await self.db.set_active_api(user_id, api_name)
+            # Check authorization (hardcoded admin or database authorized)
+            is_authorized = self._is_authorized(user_id) or (user and user.get('is_authorized', False))
 
-            if success:
-                # Get the loaded API info
-                active_api = await self.db.get_active_api(user_id)
-                await update.message.reply_text(
-                    f"✅ <b>API Loaded Successfully</b>\n\n"
-                    f"<b>Active API:</b> <code>{api_name}</code>\n"
-                    f"<b>GitHub Username:</b> <code>{active_api['github_username']}</code>\n\n"
-                    f"🚀 <b>Ready to use!</b>\n"
-                    f"• <code>/list_repos</code> - See your repositories\n"
-                    f"• <code>/public &lt;repo&gt;</code> - Make repo public\n"
-                    f"• <code>/private &lt;repo&gt;</code> - Make repo private",
-                    parse_mode='HTML'
-                )
-                await self.db.log_action(user_id, "load_api", api_name, "success")
-            else:
-                await update.message.reply_text(
-                    f"❌ <b>Failed to Load API</b>\n"
-                    f"Could not switch to API <code>{api_name}</code>.",
-                    parse_mode='HTML'
+            if is_authorized:
+                # Get user's current status; the lookups are independent, so run them together
+                apis, active_api, recent_logs = await asyncio.gather(
+                    self.db.get_user_apis(user_id),
+                    self.db.get_active_api(user_id),
+                    self.db.get_user_logs(user_id, 5)
                 )
 
-        except Exception as e:
-            logger.error(f"❌ Error in load_api_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
-
-    async def current_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /current_api command - Now with real data"""
-        try:
-            user_id = update.effective_user.id
-
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+                # Build admin status info
+                admin_status = ""
+                if is_admin:
+                    admin_status = "\n🔱 <b>Admin Status:</b> You have administrator privileges"
 
-            active_api = await self.db.get_active_api(user_id)
+                # Build API status info
+                api_status = ""
+                if apis:
+                    api_count = len(apis)
+                    if active_api:
+                        api_status = f"\n<b>📊 Your Status:</b>\n• GitHub APIs: {api_count} (Active: <code>{active_api['api_name']}</code>)\n• Recent actions: {len(recent_logs)}"
+                    else:
+                        api_status = f"\n<b>📊 Your Status:</b>\n• GitHub APIs: {api_count} (None active)\n• Use <code>/load_api &lt;name&gt;</code> to activate one"
+                else:
+                    api_status = f"\n<b>📊 Your Status:</b>\n• No GitHub APIs added yet\n• Start with <code>/add_api personal YOUR_TOKEN</code>"
 
-            if active_api:
-                created_date = active_api['created_at'][:10]
-                await update.message.reply_text(
-                    f"🔧 <b>Current Active API</b>\n\n"
-                    f"<b>Name:</b> <code>{active_api['api_name']}</code>\n"
-                    f"<b>GitHub Username:</b> <code>{active_api['github_username']}</code>\n"
-                    f"<b>Added:</b> {created_date}\n"
-                    f"<b>Status:</b> 🟢 Active\n\n"
-                    f"<b>Available Commands:</b>\n"
-                    f"• <code>/list_repos</code> - List repositories\n"
-                    f"• <code>/public &lt;repo&gt;</code> - Make repo public\n"
-                    f"• <code>/private &lt;repo&gt;</code> - Make repo private\n"
-                    f"• <code>/repo_status &lt;repo&gt;</code> - Check status",
-                    parse_mode='HTML'
+                welcome_text = _WELCOME_AUTHORIZED_TMPL.format(
+                    username=username, admin_status=admin_status, api_status=api_status
                 )
             else:
-                await update.message.reply_text(
-                    "❌ <b>No Active API</b>\n\n"
-                    "You don't have any active GitHub API loaded.\n\n"
-                    "💡 <b>Next Steps:</b>\n"
-                    "1. <code>/list_apis</code> - See your APIs\n"
-                    "2. <code>/load_api &lt;name&gt;</code> - Load an API\n"
-                    "3. Or <code>/add_api &lt;name&gt; &lt;token&gt;</code> - Add new API",
-                    parse_mode='HTML'
-                )
+                welcome_text = _WELCOME_UNAUTHORIZED_TMPL.format(user_id=user_id, username=username)
 
-        except Exception as e:
-            logger.error(f"❌ Error in current_api_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+            await update.message.reply_text(welcome_text, parse_mode='HTML')
+            logger.info("✅ Successfully processed /start for user %s", user_id)
 
-    async def remove_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /remove_api command - Now with confirmation"""
-        try:
-            user_id = update.effective_user.id
+        except Exception as e:
+            logger.exception("❌ Error in start_command: %s", e)
+            await update.message.reply_text(
+                f"❌ <b>Error in Start Command</b>\n"
+                f"Error: <code>{str(e)[:200]}</code>\n\n"
+                f"Please contact support.",
+                parse_mode='HTML'
+            )
 
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+    @requires(args=2)
+    async def add_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /add_api command - Now with real GitHub integration"""
+        user_id = update.effective_user.id
+
+        api_name, github_token = context.args
+
+        # Show processing message
+        processing_msg = await update.message.reply_text("🔍 <b>Validating GitHub token...</b>", parse_mode='HTML')
+
+        # Validate the token while a tentative row is inserted; the insert only
+        # succeeds for a new API name, existing names are updated after validation
+        github_api = GitHubAPI(github_token, "")
+        (is_valid, result), inserted = await asyncio.gather(
+            github_api.validate_token(),
+            self.db.add_github_api_tentative(user_id, api_name, github_token)
+        )
+
+        if not is_valid:
+            if inserted:
+                await self.db.discard_tentative_api(user_id, api_name)
+            await processing_msg.edit_text(
+                f"❌ <b>Invalid GitHub Token</b>\n"
+                f"Error: <code>{result}</code>\n\n"
+                f"Please check your token and try again.",
+                parse_mode='HTML'
+            )
+            return
 
-            if len(context.args) != 1:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n"
-                    "Usage: <code>/remove_api &lt;api_name&gt;</code>\n\n"
-                    "💡 Use <code>/list_apis</code> to see your APIs",
-                    parse_mode='HTML'
-                )
-                return
+        github_username = result
 
-            api_name = context.args[0]
+        # Add API to database
+        if inserted:
+            success = await self.db.mark_api_verified(user_id, api_name, github_username)
+        else:
+            success = await self.db.add_github_api(user_id, api_name, github_token, github_username)
 
-            # Check if API exists
-            apis = await self.db.get_user_apis(user_id)
-            api_to_remove = next((api for api in apis if api['api_name'] == api_name), None)
+        if success:
+            self._invalidate(user_id)
+            await processing_msg.edit_text(
+                f"✅ <b>GitHub API Added Successfully</b>\n\n"
+                f"<b>API Name:</b> <code>{api_name}</code>\n"
+                f"<b>GitHub Username:</b> <code>{github_username}</code>\n"
+                f"<b>Status:</b> Ready to use\n\n"
+                f"💡 Use <code>/load_api {api_name}</code> to activate it\n"
+                f"💡 Use <code>/list_repos</code> to see your repositories",
+                parse_mode='HTML'
+            )
 
-            if not api_to_remove:
-                available_apis = [api['api_name'] for api in apis]
-                await update.message.reply_text(
-                    f"❌ <b>API Not Found</b>\n\n"
-                    f"API <code>{api_name}</code> doesn't exist.\n\n"
-                    f"<b>Available APIs:</b> {', '.join(available_apis) if available_apis else 'None'}",
-                    parse_mode='HTML'
-                )
-                return
+            # Log action
+            self.db.queue_log(user_id, "add_api", api_name, "success")
+            logger.info("✅ Successfully added API '%s' for user %s", api_name, user_id)
+        else:
+            await processing_msg.edit_text(
+                "❌ <b>Failed to Add API</b>\n"
+                "Database error occurred. Please try again.",
+                parse_mode='HTML'
+            )
 
-            # Confirmation keyboard
-            keyboard = [
-                [InlineKeyboardButton("✅ Yes, Remove", callback_data=f"remove_api:{api_name}")],
-                [InlineKeyboardButton("❌ Cancel", callback_data="cancel")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+    @requires()
+    async def list_apis_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /list_apis command - Now with real data"""
+        user_id = update.effective_user.id
 
-            status = "🟢 Active" if api_to_remove['is_active'] else "⚪ Inactive"
+        apis = await self.db.get_user_apis(user_id)
 
+        if not apis:
             await update.message.reply_text(
-                f"⚠️ <b>Confirm API Removal</b>\n\n"
-                f"<b>API Name:</b> <code>{api_name}</code>\n"
-                f"<b>GitHub Username:</b> <code>{api_to_remove['github_username']}</code>\n"
-                f"<b>Status:</b> {status}\n\n"
-                f"Are you sure you want to remove this API?\n"
-                f"This action cannot be undone.",
-                reply_markup=reply_markup,
+                "📋 <b>No GitHub APIs Found</b>\n\n"
+                "You haven't added any GitHub APIs yet.\n\n"
+                "💡 Use <code>/add_api &lt;name&gt; &lt;token&gt;</code> to add one\n"
+                "💡 Example: <code>/add_api personal ghp_xxxxxxxxxxxx</code>",
                 parse_mode='HTML'
             )
+            return
+
+        parts = ["📋 <b>Your GitHub APIs:</b>\n\n"]
+        for api in apis:
+            status = "🟢 <b>Active</b>" if api['is_active'] else "⚪ Inactive"
+            created_date = api['created_date']
+            parts.append(
+                f"• <b>{api['api_name']}</b> ({status})\n"
+                f"  👤 Username: <code>{api['github_username']}</code>\n"
+                f"  📅 Added: {created_date}\n\n"
+            )
+        parts.append(_LIST_APIS_FOOTER_HTML)
 
-        except Exception as e:
-            logger.error(f"❌ Error in remove_api_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+        await update.message.reply_text("".join(parts), parse_mode='HTML')
 
-    async def list_repos_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /list_repos command - Now with real GitHub API"""
-        try:
-            user_id = update.effective_user.id
+    @requires(args=1)
+    async def load_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /load_api command - Now with real switching"""
+        user_id = update.effective_user.id
 
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+        api_name = context.args[0]
 
-            # Get active API
-            active_api = await self.db.get_active_api(user_id)
-            if not active_api:
-                await update.message.reply_text(
-                    "❌ <b>No Active API</b>\n\n"
-                    "Please load a GitHub API first:\n"
-                    "1. <code>/list_apis</code> - See your APIs\n"
-                    "2. <code>/load_api &lt;name&gt;</code> - Load an API\n"
-                    "3. Or <code>/add_api &lt;name&gt; &lt;token&gt;</code> - Add new API",
-                    parse_mode='HTML'
-                )
-                return
-
-            # Show loading message
-            loading_msg = await update.message.reply_text(
-                f"🔍 <b>Fetching repositories...</b>\n"
-                f"Loading repos for <code>{active_api['github_username']}</code>...",
+        # Check if API exists; the full list is only needed for the error reply
+        if not await self.db.api_exists(user_id, api_name):
+            available_apis = [api['api_name'] for api in await self.db.get_user_apis(user_id)]
+            await update.message.reply_text(
+                f"❌ <b>API Not Found</b>\n\n"
+                f"API <code>{api_name}</code> doesn't exist.\n\n"
+                f"<b>Available APIs:</b> {', '.join(available_apis) if available_apis else 'None'}\n\n"
+                f"💡 Use <code>/list_apis</code> to see all your APIs",
                 parse_mode='HTML'
             )
+            return
 
-            # Fetch repositories
-            github_api = GitHubAPI(active_api['github_token'], active_api['github_username'])
-            repositories = await github_api.list_repositories()
-
-            if not repositories:
-                await loading_msg.edit_text(
-                    f"📋 <b>No Repositories Found</b>\n\n"
-                    f"No repositories found for <code>{active_api['github_username']}</code>.\n\n"
-                    f"This could mean:\n"
-                    f"• You don't have any repositories\n"
-                    f"• The token doesn't have repository access\n"
-                    f"• There was an API error",
-                    parse_mode='HTML'
-                )
-                return
+        success = await self.db.set_active_api(user_id, api_name)
 
-            # Format repository list
-            repo_text = format_repository_list(repositories, active_api['github_username'])
-
-            # Send repository list (split if too long)
-            if len(repo_text) > 4000:
-                await loading_msg.edit_text("📋 <b>Repository List</b> (Part 1)", parse_mode='HTML')
-                chunks = [repo_text[i:i+4000] for i in range(0, len(repo_text), 4000)]
-                for i, chunk in enumerate(chunks):
-                    if i == 0:
-                        await loading_msg.edit_text(chunk, parse_mode='Markdown')
-                    else:
-                        await update.message.reply_text(
-                            f"📋 <b>Repository List</b> (Part {i+1})\n\n{chunk}",
-                            parse_mode='Markdown'
-                        )
-            else:
-                await loading_msg.edit_text(repo_text, parse_mode='Markdown')
+        if success:
+            self._invalidate(user_id)
+            # Get the loaded API info; the switch stands even if this read fails
+            active_api = await self.db.get_active_api(user_id)
+            github_username = active_api['github_username'] if active_api else "unknown"
+            await update.message.reply_text(
+                f"✅ <b>API Loaded Successfully</b>\n\n"
+                f"<b>Active API:</b> <code>{api_name}</code>\n"
+                f"<b>GitHub Username:</b> <code>{github_username}</code>\n\n"
+                f"🚀 <b>Ready to use!</b>\n"
+                f"• <code>/list_repos</code> - See your repositories\n"
+                f"• <code>/public &lt;repo&gt;</code> - Make repo public\n"
+                f"• <code>/private &lt;repo&gt;</code> - Make repo private",
+                parse_mode='HTML'
+            )
+            self.db.queue_log(user_id, "load_api", api_name, "success")
+        else:
+            await update.message.reply_text(
+                f"❌ <b>Failed to Load API</b>\n"
+                f"Could not switch to API <code>{api_name}</code>.",
+                parse_mode='HTML'
+            )
 
-        except Exception as e:
-            logger.error(f"❌ Error in list_repos_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+    @requires()
+    async def current_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /current_api command - Now with real data"""
+        user_id = update.effective_user.id
 
-    async def make_public_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /public command - Now with real GitHub API"""
-        try:
-            user_id = update.effective_user.id
+        active_api = await self.db.get_active_api(user_id)
 
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+        if active_api:
+            created_date = active_api['created_date']
+            await update.message.reply_text(
+                f"🔧 <b>Current Active API</b>\n\n"
+                f"<b>Name:</b> <code>{active_api['api_name']}</code>\n"
+                f"<b>GitHub Username:</b> <code>{active_api['github_username']}</code>\n"
+                f"<b>Added:</b> {created_date}\n"
+                f"<b>Status:</b> 🟢 Active\n\n"
+                f"<b>Available Commands:</b>\n"
+                f"• <code>/list_repos</code> - List repositories\n"
+                f"• <code>/public &lt;repo&gt;</code> - Make repo public\n"
+                f"• <code>/private &lt;repo&gt;</code> - Make repo private\n"
+                f"• <code>/repo_status &lt;repo&gt;</code> - Check status",
+                parse_mode='HTML'
+            )
+        else:
+            await update.message.reply_text(
+                "❌ <b>No Active API</b>\n\n"
+                "You don't have any active GitHub API loaded.\n\n"
+                "💡 <b>Next Steps:</b>\n"
+                "1. <code>/list_apis</code> - See your APIs\n"
+                "2. <code>/load_api &lt;name&gt;</code> - Load an API\n"
+                "3. Or <code>/add_api &lt;name&gt; &lt;token&gt;</code> - Add new API",
+                parse_mode='HTML'
+            )
 
-            if len(context.args) != 1:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n\n"
-                    "Usage: <code>/public &lt;repository_name&gt;</code>\n\n"
-                    "Examples:\n"
-                    "• <code>/public my-repo</code>\n"
-                    "• <code>/public username/my-repo</code>\n\n"
-                    "💡 Use <code>/list_repos</code> to see your repositories",
-                    parse_mode='HTML'
-                )
-                return
+    @requires(args=1)
+    async def remove_api_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /remove_api command - Now with confirmation"""
+        user_id = update.effective_user.id
 
-            repo_name = context.args[0]
-            await self._toggle_repository_visibility(update, context, repo_name, False)
+        api_name = context.args[0]
 
-        except Exception as e:
-            logger.error(f"❌ Error in make_public_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+        # Check if API exists; the full list is only needed for the error reply
+        api_to_remove = await self.db.get_api(user_id, api_name)
 
-    async def make_private_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /private command - Now with real GitHub API"""
+        if not api_to_remove:
+            available_apis = [api['api_name'] for api in await self.db.get_user_apis(user_id)]
+            await update.message.reply_text(
+                f"❌ <b>API Not Found</b>\n\n"
+                f"API <code>{api_name}</code> doesn't exist.\n\n"
+                f"<b>Available APIs:</b> {', '.join(available_apis) if available_apis else 'None'}",
+                parse_mode='HTML'
+            )
+            return
+
+        # Confirmation keyboard
+        keyboard = [
+            [InlineKeyboardButton("✅ Yes, Remove", callback_data=f"remove_api:{api_name}")],
+            [InlineKeyboardButton("❌ Cancel", callback_data="cancel")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        status = "🟢 Active" if api_to_remove['is_active'] else "⚪ Inactive"
+
+        await update.message.reply_text(
+            f"⚠️ <b>Confirm API Removal</b>\n\n"
+            f"<b>API Name:</b> <code>{api_name}</code>\n"
+            f"<b>GitHub Username:</b> <code>{api_to_remove['github_username']}</code>\n"
+            f"<b>Status:</b> {status}\n\n"
+            f"Are you sure you want to remove this API?\n"
+            f"This action cannot be undone.",
+            reply_markup=reply_markup,
+            parse_mode='HTML'
+        )
+
+    @requires(active_api=True)
+    async def list_repos_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, active_api: Dict):
+        """Handle /list_repos command - Now with real GitHub API"""
+        user_id = update.effective_user.id
+
+        # Show loading message
+        loading_msg = await update.message.reply_text(
+            f"🔍 <b>Fetching repositories...</b>\n"
+            f"Loading repos for <code>{active_api['github_username']}</code>...",
+            parse_mode='HTML'
+        )
+
+        # Fetch repositories
+        github_api = self._github_for(active_api)
+        # Reuse the last formatted listing if GitHub reports it unchanged (304s are not rate limited)
+        cache_key = (user_id, active_api['api_name'])
+        cached = self._repo_list_cache.get(cache_key)
         try:
-            user_id = update.effective_user.id
-
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
+            repositories, etag = await github_api.list_repositories_if_changed(cached[0] if cached else None)
+        except RateLimitError as e:
+            await loading_msg.edit_text(_RATE_LIMITED_HTML.format(retry_after=e.retry_after), parse_mode='HTML')
+            return
+
+        if repositories is None:
+            repo_text = cached[1]
+        elif not repositories:
+            await loading_msg.edit_text(
+                f"📋 <b>No Repositories Found</b>\n\n"
+                f"No repositories found for <code>{active_api['github_username']}</code>.\n\n"
+                f"This could mean:\n"
+                f"• You don't have any repositories\n"
+                f"• The token doesn't have repository access\n"
+                f"• There was an API error",
+                parse_mode='HTML'
+            )
+            return
+        else:
+            # Format repository list
+            if len(repositories) > _FORMAT_IN_THREAD_THRESHOLD:
+                repo_text = await asyncio.to_thread(format_repository_list, repositories, active_api['github_username'])
+            else:
+                repo_text = format_repository_list(repositories, active_api['github_username'])
+            if etag:
+                self._repo_list_cache[cache_key] = (etag, repo_text)
+            else:
+                self._repo_list_cache.pop(cache_key, None)
 
-            if len(context.args) != 1:
+        # Send repository list (split if too long)
+        # The first part replaces the loading message; the rest follow in order
+        for i, chunk in enumerate(_split(repo_text)):
+            if i == 0:
+                await loading_msg.edit_text(chunk, parse_mode='Markdown')
+            else:
                 await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n\n"
-                    "Usage: <code>/private &lt;repository_name&gt;</code>\n\n"
-                    "Examples:\n"
-                    "• <code>/private my-repo</code>\n"
-                    "• <code>/private username/my-repo</code>\n\n"
-                    "💡 Use <code>/list_repos</code> to see your repositories",
-                    parse_mode='HTML'
+                    f"📋 <b>Repository List</b> (Part {i+1})\n\n{chunk}",
+                    parse_mode='Markdown'
                 )
-                return
 
-            repo_name = context.args[0]
-            await self._toggle_repository_visibility(update, context, repo_name, True)
+    @requires(args=1, active_api=True)
+    async def make_public_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, active_api: Dict):
+        """Handle /public command - Now with real GitHub API"""
+        repo_name = context.args[0]
+        await self._toggle_repository_visibility(update, context, active_api, repo_name, False)
 
-        except Exception as e:
-            logger.error(f"❌ Error in make_private_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+    @requires(args=1, active_api=True)
+    async def make_private_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, active_api: Dict):
+        """Handle /private command - Now with real GitHub API"""
+        repo_name = context.args[0]
+        await self._toggle_repository_visibility(update, context, active_api, repo_name, True)
 
-    async def _toggle_repository_visibility(self, update: Update, context: ContextTypes.DEFAULT_TYPE, repo_name: str, make_private: bool):
+    async def _toggle_repository_visibility(self, update: Update, context: ContextTypes.DEFAULT_TYPE, active_api: Dict, repo_name: str, make_private: bool):
         """Helper method to toggle repository visibility - Now with real GitHub API"""
+        user_id = update.effective_user.id
+
+        github_api = self._github_for(active_api)
+
+        # Parse owner/repo
+        head, sep, tail = repo_name.partition('/')
+        if sep:
+            owner, repo_name = head, tail
+        else:
+            owner = active_api['github_username']
+
+        action = "make_private" if make_private else "make_public"
+        visibility = "private" if make_private else "public"
+        # Names come from the user, so escape them once for the HTML replies
+        shown_name = escape(f"{owner}/{repo_name}")
+
+        # Show processing message
+        processing_msg = await update.message.reply_text(
+            f"🔄 <b>Processing...</b>\n\n"
+            f"Making <code>{shown_name}</code> {visibility}...\n"
+            f"This may take a few seconds.",
+            parse_mode='HTML'
+        )
+
+        # Toggle repository visibility
         try:
-            user_id = update.effective_user.id
-
-            # Get active API
-            active_api = await self.db.get_active_api(user_id)
-            if not active_api:
-                await update.message.reply_text(
-                    "❌ <b>No Active API</b>\n\n"
-                    "Please load a GitHub API first using <code>/load_api &lt;name&gt;</code>",
-                    parse_mode='HTML'
-                )
-                return
-
-            github_api = GitHubAPI(active_api['github_token'], active_api['github_username'])
-
-            # Parse owner/repo
-            if '/' in repo_name:
-                owner, repo_name = repo_name.split('/', 1)
-            else:
-                owner = active_api['github_username']
-
-            action = "make_private" if make_private else "make_public"
-            visibility = "private" if make_private else "public"
-
-            # Show processing message
-            processing_msg = await update.message.reply_text(
-                f"🔄 <b>Processing...</b>\n\n"
-                f"Making <code>{owner}/{repo_name}</code> {visibility}...\n"
-                f"This may take a few seconds.",
-                parse_mode='HTML'
-            )
-
-            # Toggle repository visibility
             success, message = await github_api.toggle_repository_visibility(owner, repo_name, make_private)
-
-            if success:
-                await processing_msg.edit_text(
+        except RateLimitError as e:
+            await processing_msg.edit_text(_RATE_LIMITED_HTML.format(retry_after=e.retry_after), parse_mode='HTML')
+            self.db.queue_log(user_id, action, f"{owner}/{repo_name}", "failed")
+            return
+
+        if success:
+            # Log, then update the database while the reply is being edited
+            self.db.queue_log(user_id, action, f"{owner}/{repo_name}", "success")
+            await asyncio.gather(
+                processing_msg.edit_text(
                     f"✅ <b>Success!</b>\n\n"
-                    f"🎉 {message}\n\n"
-                    f"Repository <code>{owner}/{repo_name}</code> is now <b>{visibility}</b>.\n\n"
+                    f"🎉 {escape(message)}\n\n"
+                    f"Repository <code>{shown_name}</code> is now <b>{visibility}</b>.\n\n"
                     f"💡 You can verify this by visiting the repository on GitHub.",
                     parse_mode='HTML'
-                )
-
-                # Update database and log
-                await self.db.update_repository_status(user_id, repo_name, owner, visibility)
-                await self.db.log_action(user_id, action, f"{owner}/{repo_name}", "success")
-
-            else:
-                await processing_msg.edit_text(
-                    f"❌ <b>Failed!</b>\n\n"
-                    f"Could not make <code>{owner}/{repo_name}</code> {visibility}.\n\n"
-                    f"<b>Error:</b> {message}\n\n"
-                    f"<b>Possible reasons:</b>\n"
-                    f"• Repository doesn't exist\n"
-                    f"• You don't have permission\n"
-                    f"• Token doesn't have repo scope\n"
-                    f"• Repository is already {visibility}",
-                    parse_mode='HTML'
-                )
-                await self.db.log_action(user_id, action, f"{owner}/{repo_name}", "failed")
+                ),
+                self.db.update_repository_status(user_id, repo_name, owner, visibility)
+            )
 
-        except Exception as e:
-            logger.error(f"❌ Error in _toggle_repository_visibility: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+        else:
+            self.db.queue_log(user_id, action, f"{owner}/{repo_name}", "failed")
+            await processing_msg.edit_text(
+                f"❌ <b>Failed!</b>\n\n"
+                f"Could not make <code>{shown_name}</code> {visibility}.\n\n"
+                f"<b>Error:</b> {escape(message)}\n\n"
+                f"<b>Possible reasons:</b>\n"
+                f"• Repository doesn't exist\n"
+                f"• You don't have permission\n"
+                f"• Token doesn't have repo scope\n"
+                f"• Repository is already {visibility}",
+                parse_mode='HTML'
+            )
 
-    async def repo_status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @requires(args=1, active_api=True)
+    async def repo_status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, active_api: Dict):
         """Handle /repo_status command - Now with real GitHub API"""
-        try:
-            user_id = update.effective_user.id
-
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
-
-            if len(context.args) != 1:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n\n"
-                    "Usage: <code>/repo_status &lt;repository_name&gt;</code>\n\n"
-                    "Examples:\n"
-                    "• <code>/repo_status my-repo</code>\n"
-                    "• <code>/repo_status username/my-repo</code>",
-                    parse_mode='HTML'
-                )
-                return
-
-            # Get active API
-            active_api = await self.db.get_active_api(user_id)
-            if not active_api:
-                await update.message.reply_text(
-                    "❌ <b>No Active API</b>\n\n"
-                    "Please load a GitHub API first using <code>/load_api &lt;name&gt;</code>",
-                    parse_mode='HTML'
-                )
-                return
-
-            repo_name = context.args[0]
-            github_api = GitHubAPI(active_api['github_token'], active_api['github_username'])
-
-            # Parse owner/repo
-            if '/' in repo_name:
-                owner, repo_name = repo_name.split('/', 1)
-            else:
-                owner = active_api['github_username']
-
-            # Show loading message
-            loading_msg = await update.message.reply_text(
-                f"🔍 <b>Checking repository status...</b>\n"
-                f"Repository: <code>{owner}/{repo_name}</code>",
+        repo_name = context.args[0]
+        github_api = self._github_for(active_api)
+
+        # Parse owner/repo
+        head, sep, tail = repo_name.partition('/')
+        if sep:
+            owner, repo_name = head, tail
+        else:
+            owner = active_api['github_username']
+
+        shown_name = escape(f"{owner}/{repo_name}")
+
+        # Show loading message
+        loading_msg = await update.message.reply_text(
+            f"🔍 <b>Checking repository status...</b>\n"
+            f"Repository: <code>{shown_name}</code>",
+            parse_mode='HTML'
+        )
+
+        # Get repository info
+        repo_info = await github_api.get_repository(owner, repo_name)
+
+        if repo_info:
+            visibility = "🔒 <b>Private</b>" if repo_info['private'] else "🔓 <b>Public</b>"
+            size_mb = round(repo_info['size'] / 1024, 2) if repo_info['size'] > 0 else 0
+
+            # Escape GitHub's free-text fields once; the template is HTML
+            safe = {key: escape(value) for key, value in repo_info.items() if isinstance(value, str)}
+            await loading_msg.edit_text(
+                _REPO_STATUS_TMPL.format_map({
+                    **repo_info,
+                    **safe,
+                    'visibility': visibility,
+                    'size_mb': size_mb,
+                    'description': safe['description'] if repo_info['description'] else 'No description',
+                    'created_date': repo_info['created_at'][:10],
+                    'updated_date': repo_info['updated_at'][:10],
+                }),
+                parse_mode='HTML'
+            )
+        else:
+            await loading_msg.edit_text(
+                f"❌ <b>Repository Not Found</b>\n\n"
+                f"Repository <code>{shown_name}</code> not found.\n\n"
+                f"<b>Possible reasons:</b>\n"
+                f"• Repository doesn't exist\n"
+                f"• You don't have access to it\n"
+                f"• Repository name is incorrect\n\n"
+                f"💡 Use <code>/list_repos</code> to see available repositories",
                 parse_mode='HTML'
             )
 
-            # Get repository info
-            repo_info = await github_api.get_repository(owner, repo_name)
-
-            if repo_info:
-                visibility = "🔒 <b>Private</b>" if repo_info['private'] else "🔓 <b>Public</b>"
-                size_mb = round(repo_info['size'] / 1024, 2) if repo_info['size'] > 0 else 0
-
-                await loading_msg.edit_text(
-                    f"📊 <b>Repository Status</b>\n\n"
-                    f"<b>Name:</b> <code>{repo_info['name']}</code>\n"
-                    f"<b>Owner:</b> <code>{repo_info['owner']}</code>\n"
-                    f"<b>Full Name:</b> <code>{repo_info['full_name']}</code>\n"
-                    f"<b>Visibility:</b> {visibility}\n"
-                    f"<b>Language:</b> {repo_info['language']}\n"
-                    f"<b>Size:</b> {size_mb} MB\n"
-                    f"<b>Description:</b> {repo_info['description'] or 'No description'}\n\n"
-                    f"<b>🔗 Links:</b>\n"
-                    f"<a href='{repo_info['url']}'>View on GitHub</a>\n\n"
-                    f"<b>📅 Dates:</b>\n"
-                    f"• Created: {repo_info['created_at'][:10]}\n"
-                    f"• Updated: {repo_info['updated_at'][:10]}",
-                    parse_mode='HTML'
-                )
-            else:
-                await loading_msg.edit_text(
-                    f"❌ <b>Repository Not Found</b>\n\n"
-                    f"Repository <code>{owner}/{repo_name}</code> not found.\n\n"
-                    f"<b>Possible reasons:</b>\n"
-                    f"• Repository doesn't exist\n"
-                    f"• You don't have access to it\n"
-                    f"• Repository name is incorrect\n\n"
-                    f"💡 Use <code>/list_repos</code> to see available repositories",
-                    parse_mode='HTML'
-                )
-
-        except Exception as e:
-            logger.error(f"❌ Error in repo_status_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
-
-    async def batch_toggle_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @requires(active_api=True)
+    async def batch_toggle_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, active_api: Dict):
         """Handle /batch_toggle command - Full implementation"""
-        try:
-            user_id = update.effective_user.id
-
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
-                    parse_mode='HTML'
-                )
-                return
-
-            # Get active API
-            active_api = await self.db.get_active_api(user_id)
-            if not active_api:
-                await update.message.reply_text(
-                    "❌ <b>No Active API</b>\n\n"
-                    "Please load a GitHub API first:\n"
-                    "• <code>/list_apis</code> - See your APIs\n"
-                    "• <code>/load_api &lt;name&gt;</code> - Load an API",
-                    parse_mode='HTML'
-                )
-                return
-
-            if len(context.args) < 1:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n\n"
-                    "<b>Usage:</b>\n"
-                    "• <code>/batch_toggle &lt;repo1,repo2,repo3&gt;</code> - Toggle visibility\n"
-                    "• <code>/batch_toggle private &lt;repo1,repo2&gt;</code> - Make private\n"
-                    "• <code>/batch_toggle public &lt;repo1,repo2&gt;</code> - Make public\n\n"
-                    "<b>Examples:</b>\n"
-                    "• <code>/batch_toggle my-repo1,my-repo2,my-repo3</code>\n"
-                    "• <code>/batch_toggle private repo1,repo2</code>\n"
-                    "• <code>/batch_toggle public owner/repo1,repo2</code>",
-                    parse_mode='HTML'
-                )
-                return
-
-            # Parse arguments
-            if context.args[0].lower() in ['private', 'public']:
-                visibility_action = context.args[0].lower()
-                if len(context.args) < 2:
-                    await update.message.reply_text(
-                        "❌ <b>Missing Repository List</b>\n"
-                        "Please provide repository names after visibility option.",
-                        parse_mode='HTML'
-                    )
-                    return
-                repos_str = ','.join(context.args[1:])
-            else:
-                # Default to auto-toggle (make private if public, public if private)
-                visibility_action = 'toggle'
-                repos_str = ','.join(context.args)
-
-            # Parse repository list
-            repo_list = parse_repository_list(repos_str, active_api['github_username'])
-
-            if not repo_list:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Repository List</b>\n"
-                    "Please provide valid repository names separated by commas.",
-                    parse_mode='HTML'
-                )
-                return
+        if len(context.args) < 1:
+            await update.message.reply_text(
+                "❌ <b>Invalid Usage</b>\n\n"
+                "<b>Usage:</b>\n"
+                "• <code>/batch_toggle &lt;repo1,repo2,repo3&gt;</code> - Toggle visibility\n"
+                "• <code>/batch_toggle private &lt;repo1,repo2&gt;</code> - Make private\n"
+                "• <code>/batch_toggle public &lt;repo1,repo2&gt;</code> - Make public\n\n"
+                "<b>Examples:</b>\n"
+                "• <code>/batch_toggle my-repo1,my-repo2,my-repo3</code>\n"
+                "• <code>/batch_toggle private repo1,repo2</code>\n"
+                "• <code>/batch_toggle public owner/repo1,repo2</code>",
+                parse_mode='HTML'
+            )
+            return
 
-            if len(repo_list) > 10:
+        # Parse arguments
+        if context.args[0].lower() in ['private', 'public']:
+            visibility_action = context.args[0].lower()
+            if len(context.args) < 2:
                 await update.message.reply_text(
-                    "❌ <b>Too Many Repositories</b>\n"
-                    f"You can batch toggle maximum 10 repositories at once.\n"
-                    f"You provided {len(repo_list)} repositories.",
+                    "❌ <b>Missing Repository List</b>\n"
+                    "Please provide repository names after visibility option.",
                     parse_mode='HTML'
                 )
                 return
-
-            # Show confirmation
-            repo_names = [f"<code>{owner}/{repo_name}</code>" for owner, repo_name in repo_list]
-            confirmation_text = (
-                f"🔄 <b>Batch Toggle Confirmation</b>\n\n"
-                f"<b>Action:</b> {visibility_action.title()}\n"
-                f"<b>Repositories ({len(repo_list)}):</b>\n" + 
-                '\n'.join(f"• {name}" for name in repo_names) + 
-                f"\n\n<b>Continue?</b>"
+            repo_args = context.args[1:]
+        else:
+            # Default to auto-toggle (make private if public, public if private)
+            visibility_action = 'toggle'
+            repo_args = context.args
+
+        # Each argument holds one more entry than it has commas, so oversized
+        # lists are turned away before any of them is parsed
+        entry_count = sum(arg.count(',') for arg in repo_args) + len(repo_args)
+        if entry_count > _MAX_BATCH_REPOS:
+            await update.message.reply_text(
+                "❌ <b>Too Many Repositories</b>\n"
+                f"You can batch toggle maximum {_MAX_BATCH_REPOS} repositories at once.\n"
+                f"You provided {entry_count} repositories.",
+                parse_mode='HTML'
             )
+            return
 
-            keyboard = [
-                [InlineKeyboardButton("✅ Yes, Continue", callback_data=f"batch_confirm:{visibility_action}:{repos_str}")],
-                [InlineKeyboardButton("❌ Cancel", callback_data="cancel")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+        # Parse repository list
+        repo_list = parse_repository_list(repo_args, active_api['github_username'])
 
+        if not repo_list:
             await update.message.reply_text(
-                confirmation_text,
-                reply_markup=reply_markup,
+                "❌ <b>Invalid Repository List</b>\n"
+                "Please provide valid repository names separated by commas.",
                 parse_mode='HTML'
             )
-
-        except Exception as e:
-            logger.error(f"❌ Error in batch_toggle_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
-
-    async def _execute_batch_toggle(self, update, context, visibility_action: str, repos_str: str):
+            return
+
+        # Show confirmation
+        repo_names = [f"<code>{escape(owner)}/{escape(repo_name)}</code>" for owner, repo_name in repo_list]
+        confirmation_text = (
+            f"🔄 <b>Batch Toggle Confirmation</b>\n\n"
+            f"<b>Action:</b> {visibility_action.title()}\n"
+            f"<b>Repositories ({len(repo_list)}):</b>\n" + 
+            '\n'.join(f"• {name}" for name in repo_names) + 
+            f"\n\n<b>Continue?</b>"
+        )
+
+        # callback_data is capped at 64 bytes, so the button only carries a key
+        # to the parsed request kept in user_data
+        batches = context.user_data.setdefault('batches', {})
+        if len(batches) >= _MAX_PENDING_BATCHES:
+            batches.pop(next(iter(batches)))
+        batch_key = f"{time.monotonic_ns():x}"
+        batches[batch_key] = (visibility_action, repo_list)
+
+        keyboard = [
+            [InlineKeyboardButton("✅ Yes, Continue", callback_data=f"batch_confirm:{batch_key}")],
+            [InlineKeyboardButton("❌ Cancel", callback_data="cancel")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        await update.message.reply_text(
+            confirmation_text,
+            reply_markup=reply_markup,
+            parse_mode='HTML'
+        )
+
+    async def _execute_batch_toggle(self, update, context, visibility_action: str, repo_list: List[Tuple[str, str]]):
         """Execute the batch toggle operation"""
-        try:
-            user_id = update.effective_user.id if hasattr(update, 'effective_user') else update.from_user.id
-
-            # Get active API
-            active_api = await self.db.get_active_api(user_id)
-            if not active_api:
-                await update.edit_message_text(
-                    "❌ <b>No Active API</b>\nPlease load a GitHub API first.",
-                    parse_mode='HTML'
-                )
-                return
+        user_id = update.effective_user.id if hasattr(update, 'effective_user') else update.from_user.id
 
-            github_api = GitHubAPI(active_api['github_token'], active_api['github_username'])
-
-            # Parse repository list
-            repo_list = parse_repository_list(repos_str, active_api['github_username'])
-
-            # Show processing message
+        # Looked up again: the user may have switched or removed APIs since /batch_toggle
+        active_api = await self.db.get_active_api(user_id)
+        if not active_api:
             await update.edit_message_text(
-                f"🔄 <b>Processing Batch Operation...</b>\n\n"
-                f"Processing {len(repo_list)} repositories...\n"
-                f"This may take a few seconds.",
+                "❌ <b>No Active API</b>\nPlease load a GitHub API first.",
                 parse_mode='HTML'
             )
-
-            results = {}
-
-            if visibility_action == 'toggle':
-                # Auto-toggle: check current status first
-                for owner, repo_name in repo_list:
-                    try:
+            return
+
+        github_api = self._github_for(active_api)
+
+        # Show processing message
+        await update.edit_message_text(
+            f"🔄 <b>Processing Batch Operation...</b>\n\n"
+            f"Processing {len(repo_list)} repositories...\n"
+            f"This may take a few seconds.",
+            parse_mode='HTML'
+        )
+
+        # Work on the repositories concurrently, a few at a time
+        semaphore = asyncio.Semaphore(_BATCH_CONCURRENCY)
+
+        # Finished count, reported by a ticker at most once per interval
+        progress = {'done': 0, 'total': len(repo_list)}
+
+        async def toggle_one(owner: str, repo_name: str) -> Tuple[bool, str, str]:
+            async with semaphore:
+                try:
+                    if visibility_action == 'toggle':
+                        # Auto-toggle: check the current state on GitHub first; the
+                        # lookup is cached and ETag-revalidated, so repeats are cheap
                         repo_info = await github_api.get_repository(owner, repo_name)
-                        if repo_info:
-                            # Toggle: if private make public, if public make private
-                            make_private = not repo_info['private']
-                            success, message = await github_api.toggle_repository_visibility(owner, repo_name, make_private)
-                            results[f"{owner}/{repo_name}"] = (success, message, "private" if make_private else "public")
-                        else:
-                            results[f"{owner}/{repo_name}"] = (False, "Repository not found", "unknown")
-                    except Exception as e:
-                        results[f"{owner}/{repo_name}"] = (False, str(e), "unknown")
-
-                    # Small delay to avoid rate limiting
-                    await asyncio.sleep(0.2)
-
-            else:
-                # Specific visibility action
-                make_private = visibility_action == 'private'
-
-                for owner, repo_name in repo_list:
-                    try:
-                        success, message = await github_api.toggle_repository_visibility(owner, repo_name, make_private)
-                        results[f"{owner}/{repo_name}"] = (success, message, visibility_action)
-                    except Exception as e:
-                        results[f"{owner}/{repo_name}"] = (False, str(e), visibility_action)
-
-                    # Small delay to avoid rate limiting
-                    await asyncio.sleep(0.2)
-
-            # Update database and create results
-            success_count = 0
-            for repo_full_name, (success, message, new_visibility) in results.items():
-                owner, repo_name = repo_full_name.split('/', 1)
-
-                if success:
-                    success_count += 1
-                    await self.db.update_repository_status(user_id, repo_name, owner, new_visibility)
-                    await self.db.log_action(user_id, f"batch_{visibility_action}", repo_full_name, "success")
-                else:
-                    await self.db.log_action(user_id, f"batch_{visibility_action}", repo_full_name, "failed")
-
-            # Format results message
-            result_text = (
-                f"📊 <b>Batch Operation Results</b>\n\n"
-                f"<b>Action:</b> {visibility_action.title()}\n"
-                f"<b>Success:</b> {success_count}/{len(results)}\n\n"
-            )
-
-            for repo_name, (success, message, new_visibility) in results.items():
-                status = "✅" if success else "❌"
-                if success:
-                    result_text += f"{status} <code>{repo_name}</code> → <b>{new_visibility}</b>\n"
-                else:
-                    result_text += f"{status} <code>{repo_name}</code> - {message[:50]}{'...' if len(message) > 50 else ''}\n"
-
-            # Split message if too long
-            if len(result_text) > 4000:
-                chunks = [result_text[i:i+4000] for i in range(0, len(result_text), 4000)]
-                for i, chunk in enumerate(chunks):
-                    if i == 0:
-                        await update.edit_message_text(chunk, parse_mode='HTML')
+                        if not repo_info:
+                            return False, "Repository not found", "unknown"
+                        # Toggle: if private make public, if public make private
+                        make_private = not repo_info['private']
                     else:
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=f"📊 <b>Results</b> (Part {i+1})\n\n{chunk}",
-                            parse_mode='HTML'
-                        )
-            else:
-                await update.edit_message_text(result_text, parse_mode='HTML')
+                        make_private = visibility_action == 'private'
 
-        except Exception as e:
-            logger.error(f"❌ Error in _execute_batch_toggle: {e}")
-            try:
-                await update.edit_message_text(f"❌ <b>Batch operation failed</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
-            except:
-                pass
+                    success, message = await github_api.toggle_repository_visibility(owner, repo_name, make_private)
+                    return success, message, "private" if make_private else "public"
+                except Exception as e:
+                    return False, str(e), visibility_action if visibility_action != 'toggle' else "unknown"
+                finally:
+                    progress['done'] += 1
 
-    async def logs_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /logs command - Now with real activity logs"""
+        ticker = asyncio.create_task(self._progress_ticker(update, progress))
         try:
-            user_id = update.effective_user.id
-
-            if not self._is_authorized(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Access Denied</b>\n"
-                    "You are not authorized to use this command.",
+            outcomes = await asyncio.gather(*(toggle_one(owner, repo_name) for owner, repo_name in repo_list))
+        finally:
+            # Stop the ticker before the results replace the message
+            ticker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await ticker
+        results = {f"{owner}/{repo_name}": outcome for (owner, repo_name), outcome in zip(repo_list, outcomes)}
+
+        # Collect the database writes, then issue both in parallel
+        action = f"batch_{visibility_action}"
+        status_rows = []
+        log_rows = []
+        for repo_full_name, (success, message, new_visibility) in results.items():
+            if success:
+                owner, _, repo_name = repo_full_name.partition('/')
+                status_rows.append((repo_name, owner, new_visibility))
+            log_rows.append((action, repo_full_name, "success" if success else "failed"))
+        success_count = len(status_rows)
+
+        await asyncio.gather(
+            self.db.update_repository_status_bulk(user_id, status_rows),
+            self.db.bulk_log_action(user_id, log_rows)
+        )
+
+        # Format results message
+        parts = [_BATCH_HEADER_TMPL.format(
+            action=visibility_action.title(), success_count=success_count, total=len(results)
+        )]
+        parts.extend(
+            _BATCH_LINE_OK_TMPL.format(repo=escape(repo_name), visibility=new_visibility) if success else
+            _BATCH_LINE_FAILED_TMPL.format(repo=escape(repo_name), message=escape(message[:50]), more='...' if len(message) > 50 else '')
+            for repo_name, (success, message, new_visibility) in results.items()
+        )
+
+        # Split on line boundaries so no HTML tag is cut in half. The first part
+        # replaces the processing message while the rest are sent, in order
+        chunks = chunk_html(parts)
+
+        async def send_rest():
+            for i, chunk in enumerate(chunks[1:], start=2):
+                await context.bot.send_message(
+                    chat_id=update.message.chat_id,
+                    text=f"📊 <b>Results</b> (Part {i})\n\n{chunk}",
                     parse_mode='HTML'
                 )
-                return
 
-            logs = await self.db.get_user_logs(user_id, 20)
+        await asyncio.gather(update.edit_message_text(chunks[0], parse_mode='HTML'), send_rest())
 
-            if not logs:
-                await update.message.reply_text(
-                    "📋 <b>No Activity Logs</b>\n\n"
-                    "No recent activity found.\n\n"
-                    "Activity will be logged when you:\n"
-                    "• Add GitHub APIs\n"
-                    "• Load APIs\n"
-                    "• Change repository visibility\n"
-                    "• Perform other actions",
-                    parse_mode='HTML'
-                )
-                return
-
-            logs_text = format_logs(logs)
+    @requires()
+    async def logs_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /logs command - Now with real activity logs"""
+        user_id = update.effective_user.id
 
-            # Add summary
-            success_count = sum(1 for log in logs if log['status'] == 'success')
-            failed_count = len(logs) - success_count
+        logs = await self.db.get_user_logs(user_id, 20)
 
-            header = (
-                f"📋 <b>Activity Logs</b> (Last 20)\n\n"
-                f"<b>Summary:</b> {success_count} successful, {failed_count} failed\n\n"
+        if not logs:
+            await update.message.reply_text(
+                "📋 <b>No Activity Logs</b>\n\n"
+                "No recent activity found.\n\n"
+                "Activity will be logged when you:\n"
+                "• Add GitHub APIs\n"
+                "• Load APIs\n"
+                "• Change repository visibility\n"
+                "• Perform other actions",
+                parse_mode='HTML'
             )
+            return
 
-            full_text = header + logs_text
+        logs_text = format_logs(logs)
 
-            if len(full_text) > 4000:
-                await update.message.reply_text(header, parse_mode='HTML')
-                await update.message.reply_text(logs_text, parse_mode='Markdown')
-            else:
-                await update.message.reply_text(full_text, parse_mode='HTML')
+        # Add summary
+        success_count = sum(1 for log in logs if log['status'] == 'success')
+        failed_count = len(logs) - success_count
 
-        except Exception as e:
-            logger.error(f"❌ Error in logs_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+        header = (
+            f"📋 <b>Activity Logs</b> (Last 20)\n\n"
+            f"<b>Summary:</b> {success_count} successful, {failed_count} failed\n\n"
+        )
+
+        full_text = header + logs_text
 
+        if len(full_text) > 4000:
+            await update.message.reply_text(header, parse_mode='HTML')
+            await update.message.reply_text(logs_text, parse_mode='Markdown')
+        else:
+            await update.message.reply_text(full_text, parse_mode='HTML')
+
+    @requires(auth=False, args=1, admin=True)
     async def authorize_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /authorize command - Only for hardcoded admins"""
         try:
-            user_id = update.effective_user.id
-
-            if not Config.is_admin(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Admin Access Required</b>\n"
-                    "This command requires administrator privileges.\n\n"
-                    f"Your User ID: <code>{user_id}</code>",
-                    parse_mode='HTML'
-                )
-                return
-
-            if len(context.args) != 1:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n"
-                    "Usage: <code>/authorize &lt;user_id&gt;</code>",
-                    parse_mode='HTML'
-                )
-                return
-
-            try:
-                target_user_id = int(context.args[0])
-            except ValueError:
-                await update.message.reply_text(
-                    "❌ <b>Invalid User ID</b>\n"
-                    "Please provide a valid numeric user ID.",
-                    parse_mode='HTML'
-                )
-                return
-
-            success = await self.db.authorize_user(target_user_id)
+            target_user_id = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text(
+                "❌ <b>Invalid User ID</b>\n"
+                "Please provide a valid numeric user ID.",
+                parse_mode='HTML'
+            )
+            return
 
-            if success:
-                await update.message.reply_text(
-                    f"✅ <b>User Authorized</b>\n"
-                    f"User ID <code>{target_user_id}</code> has been authorized.\n\n"
-                    f"💡 They can now use all bot features.",
-                    parse_mode='HTML'
-                )
-            else:
-                await update.message.reply_text(
-                    f"❌ <b>Authorization Failed</b>\n"
-                    f"Could not authorize user ID <code>{target_user_id}</code>. User may not exist.",
-                    parse_mode='HTML'
-                )
+        success = await self.db.authorize_user(target_user_id)
 
-        except Exception as e:
-            logger.error(f"❌ Error in authorize_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+        if success:
+            await update.message.reply_text(
+                f"✅ <b>User Authorized</b>\n"
+                f"User ID <code>{target_user_id}</code> has been authorized.\n\n"
+                f"💡 They can now use all bot features.",
+                parse_mode='HTML'
+            )
+        else:
+            await update.message.reply_text(
+                f"❌ <b>Authorization Failed</b>\n"
+                f"Could not authorize user ID <code>{target_user_id}</code>. User may not exist.",
+                parse_mode='HTML'
+            )
 
+    @requires(auth=False, args=1, admin=True)
     async def revoke_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /revoke command - Only for hardcoded admins"""
         try:
-            user_id = update.effective_user.id
-
-            if not Config.is_admin(user_id):
-                await update.message.reply_text(
-                    "❌ <b>Admin Access Required</b>\n"
-                    "This command requires administrator privileges.",
-                    parse_mode='HTML'
-                )
-                return
-
-            if len(context.args) != 1:
-                await update.message.reply_text(
-                    "❌ <b>Invalid Usage</b>\n"
-                    "Usage: <code>/revoke &lt;user_id&gt;</code>",
-                    parse_mode='HTML'
-                )
-                return
-
-            try:
-                target_user_id = int(context.args[0])
-            except ValueError:
-                await update.message.reply_text(
-                    "❌ <b>Invalid User ID</b>\n"
-                    "Please provide a valid numeric user ID.",
-                    parse_mode='HTML'
-                )
-                return
-
-            # Prevent revoking hardcoded admins
-            if Config.is_admin(target_user_id):
-                await update.message.reply_text(
-                    f"❌ <b>Cannot Revoke Admin</b>\n"
-                    f"User ID <code>{target_user_id}</code> is a hardcoded administrator and cannot be revoked.",
-                    parse_mode='HTML'
-                )
-                return
+            target_user_id = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text(
+                "❌ <b>Invalid User ID</b>\n"
+                "Please provide a valid numeric user ID.",
+                parse_mode='HTML'
+            )
+            return
 
-            success = await self.db.revoke_user(target_user_id)
+        # Prevent revoking hardcoded admins
+        if Config.is_admin(target_user_id):
+            await update.message.reply_text(
+                f"❌ <b>Cannot Revoke Admin</b>\n"
+                f"User ID <code>{target_user_id}</code> is a hardcoded administrator and cannot be revoked.",
+                parse_mode='HTML'
+            )
+            return
 
-            if success:
-                await update.message.reply_text(
-                    f"✅ <b>User Access Revoked</b>\n"
-                    f"User ID <code>{target_user_id}</code> access has been revoked.",
-                    parse_mode='HTML'
-                )
-            else:
-                await update.message.reply_text(
-                    f"❌ <b>Revocation Failed</b>\n"
-                    f"Could not revoke access for user ID <code>{target_user_id}</code>.",
-                    parse_mode='HTML'
-                )
+        success = await self.db.revoke_user(target_user_id)
 
-        except Exception as e:
-            logger.error(f"❌ Error in revoke_command: {e}")
-            await update.message.reply_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
+        if success:
+            await update.message.reply_text(
+                f"✅ <b>User Access Revoked</b>\n"
+                f"User ID <code>{target_user_id}</code> access has been revoked.",
+                parse_mode='HTML'
+            )
+        else:
+            await update.message.reply_text(
+                f"❌ <b>Revocation Failed</b>\n"
+                f"Could not revoke access for user ID <code>{target_user_id}</code>.",
+                parse_mode='HTML'
+            )
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command with HTML formatting"""
-        help_text = """
-🤖 <b>GitHub Repository Visibility Bot</b>
-
-<b>🔑 GitHub API Management:</b>
-• <code>/add_api &lt;name&gt; &lt;token&gt;</code> - Add new GitHub API credentials
-• <code>/list_apis</code> - Show all your GitHub APIs
-• <code>/load_api &lt;name&gt;</code> - Switch to specific GitHub API
-• <code>/current_api</code> - Show currently active API
-• <code>/remove_api &lt;name&gt;</code> - Remove GitHub API credentials
-
-<b>📁 Repository Management:</b>
-• <code>/list_repos</code> - List all repositories from current API
-• <code>/public &lt;repo_name&gt;</code> - Make repository public
-• <code>/private &lt;repo_name&gt;</code> - Make repository private
-• <code>/repo_status &lt;repo_name&gt;</code> - Check current repository visibility
-• <code>/batch_toggle &lt;repos&gt;</code> - Batch toggle multiple repositories
-
-<b>📊 Activity &amp; Logs:</b>
-• <code>/logs</code> - Show recent activity logs
-
-<b>👤 Admin Commands:</b>
-• <code>/authorize &lt;user_id&gt;</code> - Authorize user access
-• <code>/revoke &lt;user_id&gt;</code> - Revoke user access
-
-<b>ℹ️ General:</b>
-• <code>/start</code> - Initialize and check your status
-• <code>/help</code> - Show this help message
-
-<b>💡 Tips:</b>
-- Repository names can include owner: <code>owner/repo</code> or just <code>repo</code>
-- All operations are logged for audit purposes
-- Your GitHub tokens are encrypted and stored securely
-
-<b>🔒 Security:</b>
-- GitHub tokens are encrypted before storage
-- All actions are logged for audit purposes
-- Access control prevents unauthorized usage
-
-<b>🚀 Getting Started:</b>
-1. Add your GitHub token: <code>/add_api personal YOUR_TOKEN</code>
-2. Load the API: <code>/load_api personal</code>
-3. List your repos: <code>/list_repos</code>
-4. Manage visibility: <code>/public repo-name</code> or <code>/private repo-name</code>
-        """
-
         try:
-            await update.message.reply_text(help_text, parse_mode='HTML')
+            await update.message.reply_text(_HELP_HTML, parse_mode='HTML')
         except Exception as e:
-            logger.error(f"❌ Error in help_command: {e}")
+            logger.error("❌ Error in help_command: %s", e)
             # Fallback without formatting if there's an issue
-            await update.message.reply_text(help_text.replace('<b>', '').replace('</b>', '').replace('<code>', '').replace('</code>', ''))
+            await update.message.reply_text(_HELP_PLAIN)
 
     # Callback query handlers
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle button callbacks - Now functional"""
-        try:
-            query = update.callback_query
-            await query.answer()
-
-            if query.data == "cancel":
-                await query.edit_message_text("❌ <b>Operation Cancelled</b>", parse_mode='HTML')
-                return
-
-            if query.data.startswith("remove_api:"):
-                api_name = query.data.split(":", 1)[1]
-                user_id = query.from_user.id
+        query = update.callback_query
+        await query.answer()
+
+        # callback_data is "<kind>" or "<kind>:<payload>"
+        kind, _, payload = query.data.partition(":")
+        handler = self._callbacks.get(kind)
+        if handler:
+            await handler(query, context, payload)
+        else:
+            logger.warning("Unknown callback data: %s", query.data)
+
+    async def _cb_cancel(self, query, context: ContextTypes.DEFAULT_TYPE, payload: str):
+        await query.edit_message_text("❌ <b>Operation Cancelled</b>", parse_mode='HTML')
+
+    async def _cb_remove_api(self, query, context: ContextTypes.DEFAULT_TYPE, api_name: str):
+        user_id = query.from_user.id
+
+        success = await self.db.remove_github_api(user_id, api_name)
+
+        if success:
+            self._invalidate(user_id)
+            await query.edit_message_text(
+                f"✅ <b>API Removed Successfully</b>\n\n"
+                f"API <code>{api_name}</code> has been removed from your account.\n\n"
+                f"💡 Use <code>/list_apis</code> to see your remaining APIs",
+                parse_mode='HTML'
+            )
+            self.db.queue_log(user_id, "remove_api", api_name, "success")
+        else:
+            await query.edit_message_text(
+                f"❌ <b>Failed to Remove API</b>\n\n"
+                f"Could not remove API <code>{api_name}</code>.\n"
+                f"Please try again or contact support.",
+                parse_mode='HTML'
+            )
 
-                success = await self.db.remove_github_api(user_id, api_name)
+    async def _cb_batch_confirm(self, query, context: ContextTypes.DEFAULT_TYPE, batch_key: str):
+        # Each confirmation can only run once
+        batch = context.user_data.get('batches', {}).pop(batch_key, None)
+        if batch:
+            visibility_action, repo_list = batch
+            await self._execute_batch_toggle(query, context, visibility_action, repo_list)
+        else:
+            await query.edit_message_text(
+                "❌ <b>Confirmation Expired</b>\n"
+                "Please run <code>/batch_toggle</code> again.",
+                parse_mode='HTML'
+            )
 
-                if success:
-                    await query.edit_message_text(
-                        f"✅ <b>API Removed Successfully</b>\n\n"
-                        f"API <code>{api_name}</code> has been removed from your account.\n\n"
-                        f"💡 Use <code>/list_apis</code> to see your remaining APIs",
-                        parse_mode='HTML'
-                    )
-                    await self.db.log_action(user_id, "remove_api", api_name, "success")
-                else:
-                    await query.edit_message_text(
-                        f"❌ <b>Failed to Remove API</b>\n\n"
-                        f"Could not remove API <code>{api_name}</code>.\n"
-                        f"Please try again or contact support.",
-                        parse_mode='HTML'
-                    )
-
-            elif query.data.startswith("batch_confirm:"):
-                # Handle batch toggle confirmation
-                parts = query.data.split(":", 2)
-                if len(parts) == 3:
-                    visibility_action = parts[1]
-                    repos_str = parts[2]
-                    await self._execute_batch_toggle(query, context, visibility_action, repos_str)
-                else:
-                    await query.edit_message_text("❌ <b>Invalid confirmation data</b>", parse_mode='HTML')
+    async def _progress_ticker(self, query, progress: Dict[str, int], interval: float = _PROGRESS_INTERVAL):
+        """Show batch progress in the processing message until cancelled"""
+        shown = 0
+        while True:
+            await asyncio.sleep(interval)
+            done = progress['done']
+            if done == shown:
+                continue
+            shown = done
+            try:
+                await query.edit_message_text(
+                    f"🔄 <b>Processing Batch Operation...</b>\n\n"
+                    f"Processed {done}/{progress['total']} repositories...",
+                    parse_mode='HTML'
+                )
+            except BadRequest as e:
+                # Progress is best effort; e.g. "message is not modified"
+                logger.debug("Progress update skipped: %s", e)
 
+    async def _safe_reply_error(self, update: Update, text: str):
+        """Report a failure where the user will see it, never raising"""
+        try:
+            if update.callback_query:
+                await update.callback_query.edit_message_text(text, parse_mode='HTML')
+            else:
+                await update.effective_message.reply_text(text, parse_mode='HTML')
         except Exception as e:
-            logger.error(f"❌ Error in button_callback: {e}")
-            try:
-                await update.callback_query.edit_message_text(f"❌ <b>Error</b>: <code>{str(e)[:200]}</code>", parse_mode='HTML')
-            except:
-                pass
+            logger.error("Could not send error message: %s", e)
 
     # Error handler
-    async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle errors"""
-        logger.error(f"Update {update} caused error {context.error}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+    async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Handle errors raised by any handler"""
+        logger.error("Update %s caused %s: %s", update, type(context.error).__name__, context.error,
+                     exc_info=context.error)
 
-        if update and update.effective_message:
-            try:
-                await update.effective_message.reply_text(
-                    "❌ <b>An Error Occurred</b>\n"
-                    "Something went wrong. Please try again later or contact support.",
-                    parse_mode='HTML'
-                )
-            except Exception as e:
-                logger.error(f"Could not send error message: {e}")
+        if isinstance(update, Update) and update.effective_message:
+            await self._safe_reply_error(update, _ERROR_TMPL.format(error=escape(str(context.error)[:200])))
@@ -1,20 +1,79 @@
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
 import signal
 import sys
-import traceback
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler
 from app.config import Config
 from app.handlers import BotHandlers
-from app.database import Database
+from app.github_api import GitHubAPI
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread"""
+
+    def prepare(self, record):
+        # The stock prepare() formats the whole record, traceback included, on
+        # the logging thread. Only the message is rendered here, so arguments
+        # changed after the call cannot alter it; the rest waits for the listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# Configure detailed logging. Records are only queued on the event loop thread;
+# a listener thread formats them and writes them to stderr
+_log_queue = queue.SimpleQueue()
+_stream_handler = logging.StreamHandler(sys.stderr)
+_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _stream_handler, respect_handler_level=True)
+_log_listener.start()
+
+_queue_handler = _DeferredQueueHandler(_log_queue)
+
+def _stop_log_listener():
+    """Flush whatever is still queued and stop the listener thread, once"""
+    # QueueListener.stop() fails when called a second time
+    if _log_listener._thread is not None:
+        _log_listener.stop()
+        # Anything logged after shutdown goes straight to stderr
+        root = logging.getLogger()
+        root.removeHandler(_queue_handler)
+        root.addHandler(_stream_handler)
+
+# Covers exits that never reach GitHubVisibilityBot.stop()
+atexit.register(_stop_log_listener)
 
-# Configure detailed logging
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[_queue_handler],
     level=logging.DEBUG  # Changed to DEBUG for more details
 )
 logger = logging.getLogger(__name__)
 
+# Bot commands and the BotHandlers method serving each
+_COMMANDS = (
+    # Basic commands
+    ("start", "start_command"),
+    ("help", "help_command"),
+    # GitHub API management
+    ("add_api", "add_api_command"),
+    ("list_apis", "list_apis_command"),
+    ("load_api", "load_api_command"),
+    ("current_api", "current_api_command"),
+    ("remove_api", "remove_api_command"),
+    # Repository management
+    ("list_repos", "list_repos_command"),
+    ("public", "make_public_command"),
+    ("private", "make_private_command"),
+    ("repo_status", "repo_status_command"),
+    ("batch_toggle", "batch_toggle_command"),
+    # Activity logs
+    ("logs", "logs_command"),
+    # Admin commands
+    ("authorize", "authorize_command"),
+    ("revoke", "revoke_command"),
+)
+
 class GitHubVisibilityBot:
     def __init__(self):
         logger.info("=== Initializing GitHubVisibilityBot ===")
@@ -26,41 +85,32 @@ class GitHubVisibilityBot:
 
             # Log configuration status (safely)
             logger.info("Configuration Status:")
-            logger.info(f"  - Telegram Bot Token: {'✅ SET' if Config.TELEGRAM_BOT_TOKEN else '❌ NOT SET'}")
-            logger.info(f"  - Database URL: {'✅ SET' if Config.DATABASE_URL else '❌ NOT SET'}")
-            logger.info(f"  - Encryption Key: {'✅ SET' if Config.ENCRYPTION_KEY else '❌ NOT SET'}")
-            logger.info(f"  - Admin User IDs: {Config.ADMIN_USER_IDS}")
+            logger.info("  - Telegram Bot Token: %s", '✅ SET' if Config.TELEGRAM_BOT_TOKEN else '❌ NOT SET')
+            logger.info("  - Database URL: %s", '✅ SET' if Config.DATABASE_URL else '❌ NOT SET')
+            logger.info("  - Encryption Key: %s", '✅ SET' if Config.ENCRYPTION_KEY else '❌ NOT SET')
+            logger.info("  - Admin User IDs: %s", Config.ADMIN_USER_IDS)
             logger.info("✅ Configuration validated successfully")
 
         except Exception as e:
-            logger.error(f"❌ Configuration validation failed: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("❌ Configuration validation failed: %s", e)
             raise
 
         try:
-            # Test database connection
-            logger.info("Testing Render PostgreSQL connection...")
-            db = Database()
-            logger.info("✅ Render PostgreSQL database initialized successfully")
-
-        except Exception as e:
-            logger.error(f"❌ Database initialization failed: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            raise
-
-        try:
-            # Initialize handlers
+            # Initialize handlers; their Database is the bot's only connection
+            # pool, and it tests the Render PostgreSQL connection as it opens
             logger.info("Creating bot handlers...")
             self.handlers = BotHandlers()
+            logger.info("✅ Render PostgreSQL database initialized successfully")
             logger.info("✅ Bot handlers created successfully")
 
         except Exception as e:
-            logger.error(f"❌ Failed to create bot handlers: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("❌ Failed to create bot handlers: %s", e)
             raise
 
         self.application = None
         self._running = False
+        # Set to make start() return and shut the bot down
+        self._stop_event = asyncio.Event()
         logger.info("✅ GitHubVisibilityBot initialization completed")
 
     def setup_handlers(self):
@@ -68,77 +118,20 @@ class GitHubVisibilityBot:
         logger.info("Setting up command handlers...")
 
         try:
-            # Basic commands
-            logger.debug("Adding basic command handlers...")
-            self.application.add_handler(CommandHandler("start", self.handlers.start_command))
-            self.application.add_handler(CommandHandler("help", self.handlers.help_command))
-
-            # GitHub API management
-            logger.debug("Adding GitHub API management handlers...")
-            self.application.add_handler(CommandHandler("add_api", self.handlers.add_api_command))
-            self.application.add_handler(CommandHandler("list_apis", self.handlers.list_apis_command))
-            self.application.add_handler(CommandHandler("load_api", self.handlers.load_api_command))
-            self.application.add_handler(CommandHandler("current_api", self.handlers.current_api_command))
-            self.application.add_handler(CommandHandler("remove_api", self.handlers.remove_api_command))
-
-            # Repository management
-            logger.debug("Adding repository management handlers...")
-            self.application.add_handler(CommandHandler("list_repos", self.handlers.list_repos_command))
-            self.application.add_handler(CommandHandler("public", self.handlers.make_public_command))
-            self.application.add_handler(CommandHandler("private", self.handlers.make_private_command))
-            self.application.add_handler(CommandHandler("repo_status", self.handlers.repo_status_command))
-            self.application.add_handler(CommandHandler("batch_toggle", self.handlers.batch_toggle_command))
-
-            # Activity logs
-            logger.debug("Adding activity log handlers...")
-            self.application.add_handler(CommandHandler("logs", self.handlers.logs_command))
-
-            # Admin commands
-            logger.debug("Adding admin command handlers...")
-            self.application.add_handler(CommandHandler("authorize", self.handlers.authorize_command))
-            self.application.add_handler(CommandHandler("revoke", self.handlers.revoke_command))
-
-            # Callback query handler
-            logger.debug("Adding callback query handler...")
-            self.application.add_handler(CallbackQueryHandler(self.handlers.button_callback))
-
-            # Enhanced error handler
-            logger.debug("Adding enhanced error handler...")
-            async def enhanced_error_handler(update, context):
-                error_message = str(context.error)
-                error_type = type(context.error).__name__
-
-                logger.error(f"=== TELEGRAM BOT ERROR ===")
-                logger.error(f"Update: {update}")
-                logger.error(f"Error Type: {error_type}")
-                logger.error(f"Error Message: {error_message}")
-                logger.error(f"Full Error: {context.error}")
-                logger.error(f"Traceback: {traceback.format_exc()}")
-                logger.error("========================")
-
-                if update and update.effective_message:
-                    try:
-                        await update.effective_message.reply_text(
-                            f"❌ **Detailed Error Information**\n\n"
-                            f"**Error Type:** `{error_type}`\n"
-                            f"**Error:** `{error_message[:200]}{'...' if len(error_message) > 200 else ''}`\n\n"
-                            f"**Debug Info:**\n"
-                            f"• User ID: `{update.effective_user.id if update.effective_user else 'Unknown'}`\n"
-                            f"• Chat ID: `{update.effective_chat.id if update.effective_chat else 'Unknown'}`\n"
-                            f"• Message: `{update.effective_message.text[:50] if update.effective_message and update.effective_message.text else 'No text'}{'...' if update.effective_message and update.effective_message.text and len(update.effective_message.text) > 50 else ''}`\n\n"
-                            f"Please report this error to the administrator.",
-                            parse_mode='Markdown'
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to send error message to user: {e}")
-
-            self.application.add_error_handler(enhanced_error_handler)
+            self.application.add_handlers(
+                [CommandHandler(command, getattr(self.handlers, attr)) for command, attr in _COMMANDS]
+                + [CallbackQueryHandler(self.handlers.button_callback)]
+            )
+            logger.debug("Registered %d handlers", len(_COMMANDS) + 1)
+
+            # Every handler's unexpected errors end up here
+            logger.debug("Adding error handler...")
+            self.application.add_error_handler(self.handlers.error_handler)
 
             logger.info("✅ All command handlers set up successfully")
 
         except Exception as e:
-            logger.error(f"❌ Failed to setup handlers: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("❌ Failed to setup handlers: %s", e)
             raise
 
     async def initialize(self):
@@ -147,8 +140,12 @@ class GitHubVisibilityBot:
 
         try:
             # Create application
-            logger.debug(f"Creating application with token: {Config.TELEGRAM_BOT_TOKEN[:10]}...")
-            self.application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+            token = Config.TELEGRAM_BOT_TOKEN
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Creating application with token: %s...", token[:10])
+            self.application = Application.builder().token(token).build()
+            # Shared with the app.auth decorators, so they reuse the handlers' pool
+            self.application.bot_data['db'] = self.handlers.db
             logger.info("✅ Telegram application created successfully")
 
             # Setup handlers
@@ -156,8 +153,7 @@ class GitHubVisibilityBot:
             logger.info("✅ Bot initialization completed successfully!")
 
         except Exception as e:
-            logger.error(f"❌ Bot initialization failed: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("❌ Bot initialization failed: %s", e)
             raise
 
     async def start(self):
@@ -191,13 +187,11 @@ class GitHubVisibilityBot:
             logger.info("🎉 Bot is now running and polling for updates!")
             logger.info("📱 Send /start to test the bot")
 
-            # Keep the bot running
-            while self._running:
-                await asyncio.sleep(1)
+            # Keep the bot running until a signal or stop() asks it to finish
+            await self._stop_event.wait()
 
         except Exception as e:
-            logger.error(f"❌ Error during bot execution: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("❌ Error during bot execution: %s", e)
             raise
         finally:
             await self.stop()
@@ -210,6 +204,7 @@ class GitHubVisibilityBot:
 
         logger.info("🛑 Stopping bot gracefully...")
         self._running = False
+        self._stop_event.set()
 
         try:
             if self.application:
@@ -230,47 +225,54 @@ class GitHubVisibilityBot:
                 await self.application.shutdown()
                 logger.info("✅ Application shutdown completed")
 
+            # Release pooled GitHub connections
+            await GitHubAPI.close()
+
+            # Write pending audit logs and close database connections
+            await self.handlers.db.close()
+
             logger.info("✅ Bot stopped successfully!")
 
         except Exception as e:
-            logger.error(f"❌ Error during bot shutdown: {e}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception("❌ Error during bot shutdown: %s", e)
+        finally:
+            # Write out the shutdown records now rather than at interpreter exit
+            _stop_log_listener()
 
     def setup_signal_handlers(self):
         """Setup signal handlers for graceful shutdown"""
         logger.debug("Setting up signal handlers...")
 
-        def signal_handler(signum, frame):
+        loop = asyncio.get_running_loop()
+
+        def signal_handler(signum):
             signal_name = signal.Signals(signum).name
-            logger.info(f"📡 Received signal {signal_name} ({signum}), initiating shutdown...")
-            self._running = False
+            logger.info("📡 Received signal %s (%s), initiating shutdown...", signal_name, signum)
+            self._stop_event.set()
 
         try:
-            signal.signal(signal.SIGINT, signal_handler)
-            signal.signal(signal.SIGTERM, signal_handler)
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    # Runs the handler as a normal loop callback
+                    loop.add_signal_handler(signum, signal_handler, signum)
+                except NotImplementedError:
+                    # Not available on Windows; hand the event back to the loop thread
+                    signal.signal(signum, lambda signum, frame: loop.call_soon_threadsafe(signal_handler, signum))
             logger.debug("✅ Signal handlers set up successfully")
         except Exception as e:
-            logger.warning(f"⚠️ Could not set up signal handlers: {e}")
+            logger.warning("⚠️ Could not set up signal handlers: %s", e)
 
 def get_event_loop():
-    """Get or create event loop safely"""
+    """Get the event loop already running in this thread, if any"""
     logger.debug("Checking event loop status...")
 
     try:
-        # Try to get existing event loop
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            logger.info("📍 Event loop is already running (deployment environment)")
-            return loop, True
-        else:
-            logger.info("📍 Event loop exists but not running")
-            return loop, False
-    except RuntimeError as e:
-        logger.info(f"📍 No event loop exists, creating new one: {e}")
-        # No event loop exists, create a new one
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop, False
+        loop = asyncio.get_running_loop()
+        logger.info("📍 Event loop is already running (deployment environment)")
+        return loop, True
+    except RuntimeError:
+        logger.info("📍 No event loop is running")
+        return None, False
 
 async def run_bot():
     """Run the bot async"""
@@ -286,15 +288,17 @@ async def run_bot():
     except KeyboardInterrupt:
         logger.info("⌨️ Bot stopped by user (KeyboardInterrupt)")
     except Exception as e:
-        logger.error(f"💥 Bot crashed in run_bot(): {e}")
-        logger.error(f"Error Type: {type(e).__name__}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.exception("💥 Bot crashed in run_bot(): %s", e)
         raise
     finally:
         logger.info("🏁 Bot runner finished")
 
+# Keeps the bot task referenced while an external event loop runs it
+_bot_task = None
+
 def main():
     """Main entry point"""
+    global _bot_task
     logger.info("=" * 50)
     logger.info("🤖 GITHUB VISIBILITY BOT STARTING")
     logger.info("=" * 50)
@@ -303,43 +307,24 @@ def main():
         loop, is_running = get_event_loop()
 
         if is_running:
-            # Event loop is already running (e.g., in deployment environment)
-            logger.info("🔄 Using existing event loop")
-            task = asyncio.create_task(run_bot())
-
-            # Keep the main thread alive
-            try:
-                loop.run_until_complete(task)
-            except RuntimeError as e:
-                if "This event loop is already running" in str(e):
-                    # Handle the case where we can't wait for the task
-                    logger.info("🔄 Event loop already running, using alternative wait method")
-
-                    # Create a simple blocking wait
-                    import time
-                    try:
-                        logger.info("⏳ Keeping main thread alive...")
-                        while not task.done():
-                            time.sleep(1)
-                    except KeyboardInterrupt:
-                        logger.info("⌨️ Received interrupt signal in main thread")
-                        task.cancel()
-                else:
-                    logger.error(f"❌ Unexpected RuntimeError: {e}")
-                    raise
+            # Event loop is already running (e.g., in deployment environment). It
+            # belongs to this thread, so blocking here would stall it; the loop's
+            # owner drives the bot instead
+            logger.info("🔄 Scheduling bot on the existing event loop")
+            _bot_task = loop.create_task(run_bot())
         else:
-            # No event loop running, safe to use asyncio.run()
+            # No event loop running; the runner owns the loop and closes it, its
+            # executor and async generators when the bot finishes
             logger.info("🆕 Creating new event loop")
-            asyncio.run(run_bot())
+            with asyncio.Runner() as runner:
+                runner.run(run_bot())
 
         logger.info("✅ Main execution completed successfully")
 
     except KeyboardInterrupt:
         logger.info("⌨️ Bot stopped by user in main()")
     except Exception as e:
-        logger.error(f"💥 FATAL ERROR in main(): {e}")
-        logger.error(f"Error Type: {type(e).__name__}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.exception("💥 FATAL ERROR in main(): %s", e)
         sys.exit(1)
     finally:
         logger.info("=" * 50)
@@ -1,22 +1,47 @@
-from typing import List, Dict, Tuple
+import re
+import sys
+from functools import lru_cache
+from typing import List, Dict, Tuple, Union
 from datetime import datetime
 
+# format_logs icon per status; anything else is shown as a failure
+_STATUS_ICONS = {'success': "✅"}
+
+# datetime.fromisoformat understands a trailing 'Z' from Python 3.11
+_FROMISOFORMAT_ACCEPTS_Z = sys.version_info >= (3, 11)
+
+_COMMANDS_FOOTER = (
+    "\n💡 **Commands:**\n"
+    "• `/public <repo-name>` - Make public\n"
+    "• `/private <repo-name>` - Make private\n"
+    "• `/repo_status <repo-name>` - Check status"
+)
+
+@lru_cache(maxsize=256)
+def _summary_header(username: str, total: int, public: int, private: int) -> str:
+    """Render the heading and counts of a repository listing"""
+    return (
+        f"📋 **Repositories for {username}**\n\n"
+        f"**📊 Summary:**\n"
+        f"• Total: {total} repositories\n"
+        f"• 🔓 Public: {public}\n"
+        f"• 🔒 Private: {private}\n\n"
+    )
+
 def format_repository_list(repositories: List[Dict], username: str) -> str:
     """Format repository list for display"""
     if not repositories:
         return "📋 **No repositories found**"
 
-    public_repos = [repo for repo in repositories if not repo['private']]
-    private_repos = [repo for repo in repositories if repo['private']]
+    # One pass over the list, one lookup of 'private' per repository
+    public_repos, private_repos = [], []
+    for repo in repositories:
+        (private_repos if repo['private'] else public_repos).append(repo)
 
-    text = f"📋 **Repositories for {username}**\n\n"
-    text += f"**📊 Summary:**\n"
-    text += f"• Total: {len(repositories)} repositories\n"
-    text += f"• 🔓 Public: {len(public_repos)}\n"
-    text += f"• 🔒 Private: {len(private_repos)}\n\n"
+    parts = [_summary_header(username, len(repositories), len(public_repos), len(private_repos))]
 
     if private_repos:
-        text += "🔒 **Private Repositories:**\n"
+        parts.append("🔒 **Private Repositories:**\n")
         for repo in private_repos[:15]:  # Show first 15
             desc = repo['description']
             if desc and len(desc) > 40:
@@ -24,16 +49,16 @@ def format_repository_list(repositories: List[Dict], username: str) -> str:
             elif not desc:
                 desc = "No description"
 
-            size_mb = round(repo['size'] / 1024, 2) if repo['size'] > 0 else 0
-            text += f"• `{repo['name']}` ({size_mb}MB)\n"
-            text += f"  {desc}\n"
+            size = repo['size']
+            size_mb = round(size / 1024, 2) if size > 0 else 0
+            parts.append(f"• `{repo['name']}` ({size_mb}MB)\n  {desc}\n")
 
         if len(private_repos) > 15:
-            text += f"  ... and {len(private_repos) - 15} more private repos\n"
-        text += "\n"
+            parts.append(f"  ... and {len(private_repos) - 15} more private repos\n")
+        parts.append("\n")
 
     if public_repos:
-        text += "🔓 **Public Repositories:**\n"
+        parts.append("🔓 **Public Repositories:**\n")
         for repo in public_repos[:15]:  # Show first 15
             desc = repo['description']
             if desc and len(desc) > 40:
@@ -41,84 +66,96 @@ def format_repository_list(repositories: List[Dict], username: str) -> str:
             elif not desc:
                 desc = "No description"
 
-            size_mb = round(repo['size'] / 1024, 2) if repo['size'] > 0 else 0
-            text += f"• `{repo['name']}` ({size_mb}MB)\n"
-            text += f"  {desc}\n"
+            size = repo['size']
+            size_mb = round(size / 1024, 2) if size > 0 else 0
+            parts.append(f"• `{repo['name']}` ({size_mb}MB)\n  {desc}\n")
 
         if len(public_repos) > 15:
-            text += f"  ... and {len(public_repos) - 15} more public repos\n"
+            parts.append(f"  ... and {len(public_repos) - 15} more public repos\n")
 
-    text += "\n💡 **Commands:**\n"
-    text += "• `/public <repo-name>` - Make public\n"
-    text += "• `/private <repo-name>` - Make private\n"
-    text += "• `/repo_status <repo-name>` - Check status"
+    parts.append(_COMMANDS_FOOTER)
 
-    return text
+    return "".join(parts)
 
 def format_logs(logs: List[Dict]) -> str:
     """Format activity logs for display"""
     if not logs:
         return "📋 **No recent activity**"
 
-    text = ""
-
+    parts = []
     for log in logs:
-        timestamp = datetime.fromisoformat(log['timestamp'].replace('Z', '+00:00'))
+        # The database hands back datetimes; ISO strings are parsed
+        timestamp = log['timestamp']
+        if isinstance(timestamp, str):
+            if not _FROMISOFORMAT_ACCEPTS_Z and timestamp.endswith('Z'):
+                timestamp = timestamp[:-1] + '+00:00'
+            timestamp = datetime.fromisoformat(timestamp)
         formatted_time = timestamp.strftime("%m/%d %H:%M")
 
-        status_icon = "✅" if log['status'] == 'success' else "❌"
+        status_icon = _STATUS_ICONS.get(log['status'], "❌")
         action_name = log['action'].replace('_', ' ').title()
 
-        text += f"{status_icon} **{action_name}**\n"
-        text += f"   📁 {log['repository']}\n"
-        text += f"   🕐 {formatted_time}\n\n"
+        parts.append(
+            f"{status_icon} **{action_name}**\n"
+            f"   📁 {log['repository']}\n"
+            f"   🕐 {formatted_time}\n\n"
+        )
 
-    return text
+    return "".join(parts)
 
-def parse_repository_list(repos_str: str, default_owner: str) -> List[Tuple[str, str]]:
-    """Parse comma-separated repository list"""
-    if not repos_str:
+def parse_repository_list(repos: Union[str, List[str]], default_owner: str) -> List[Tuple[str, str]]:
+    """Parse a comma-separated repository list, or a list of such strings"""
+    if not repos:
         return []
 
+    tokens = [repos] if isinstance(repos, str) else repos
     repo_list = []
-    repos = [repo.strip() for repo in repos_str.split(',') if repo.strip()]
-
-    for repo in repos:
-        if '/' in repo:
-            owner, repo_name = repo.split('/', 1)
-            repo_list.append((owner.strip(), repo_name.strip()))
+    # Strip each entry once; after that only the sides next to '/' can hold spaces
+    for repo in (entry.strip() for token in tokens for entry in token.split(',')):
+        if not repo:
+            continue
+        owner, sep, repo_name = repo.partition('/')
+        if sep:
+            repo_list.append((owner.rstrip(), repo_name.lstrip()))
         else:
-            repo_list.append((default_owner, repo.strip()))
+            repo_list.append((default_owner, repo))
 
     return repo_list
 
+def chunk_html(lines: List[str], limit: int = 4000) -> List[str]:
+    """Group lines into chunks of at most limit characters without splitting a line"""
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        if current and size + len(line) > limit:
+            chunks.append(''.join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line)
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+# Personal access tokens start with 'ghp_', app tokens with 'ghs_'; classic
+# tokens are 40 character hex strings. All of them are 40 characters long
+_TOKEN_RE = re.compile(r'gh[ps]_[A-Za-z0-9]{36}|[0-9a-fA-F]{40}')
+
+# Deletes the characters sanitize_input strips
+_SANITIZE_TABLE = str.maketrans('', '', '<>&"\'`')
+
 def sanitize_input(text: str) -> str:
     """Sanitize user input"""
     if not text:
         return ""
 
     # Remove potentially dangerous characters
-    dangerous_chars = ['<', '>', '&', '"', "'", '`']
-    for char in dangerous_chars:
-        text = text.replace(char, '')
-
-    return text.strip()
+    return text.translate(_SANITIZE_TABLE).strip()
 
 def validate_github_token_format(token: str) -> bool:
     """Validate GitHub token format"""
-    if not token:
+    # Every accepted format is 40 characters, so most malformed input never reaches the regex
+    if not token or len(token) != 40:
         return False
-
-    # GitHub personal access tokens start with 'ghp_' and are 40 characters long
-    if token.startswith('ghp_') and len(token) == 40:
-        return True
-
-    # GitHub app tokens start with 'ghs_' and are 40 characters long
-    if token.startswith('ghs_') and len(token) == 40:
-        return True
-
-    # Classic tokens are 40 character hex strings
-    if len(token) == 40 and all(c in '0123456789abcdefABCDEF' for c in token):
-        return True
-
-    return False
+    return _TOKEN_RE.fullmatch(token) is not None
@@ -14,13 +14,21 @@ CREATE TABLE IF NOT EXISTS github_apis (
     id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
     api_name VARCHAR(255) NOT NULL,
-    github_token TEXT NOT NULL, -- Encrypted with Fernet
+    github_token TEXT NOT NULL, -- AES-GCM (or older Fernet) token, url-safe base64
+    token_hash BYTEA, -- SHA-256 of the plaintext token
     github_username VARCHAR(255) NOT NULL,
     is_active BOOLEAN DEFAULT FALSE,
+    verified BOOLEAN NOT NULL DEFAULT TRUE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     UNIQUE(user_id, api_name)
 );
 
+-- Upgrade: add token_hash to existing github_apis tables
+ALTER TABLE github_apis ADD COLUMN IF NOT EXISTS token_hash BYTEA;
+
+-- Upgrade: add verified to existing github_apis tables
+ALTER TABLE github_apis ADD COLUMN IF NOT EXISTS verified BOOLEAN NOT NULL DEFAULT TRUE;
+
 -- Repositories table
 CREATE TABLE IF NOT EXISTS repositories (
     id SERIAL PRIMARY KEY,
@@ -46,9 +54,32 @@ CREATE TABLE IF NOT EXISTS audit_logs (
 CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id);
 CREATE INDEX IF NOT EXISTS idx_github_apis_user_id ON github_apis(user_id);
 CREATE INDEX IF NOT EXISTS idx_github_apis_user_active ON github_apis(user_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_github_apis_token_hash ON github_apis(token_hash);
 CREATE INDEX IF NOT EXISTS idx_repositories_user_id ON repositories(user_id);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_user_id ON audit_logs(user_id);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp ON audit_logs(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user_timestamp ON audit_logs(user_id, timestamp DESC);
+
+-- Older databases never enforced a single active API: keep only each user's most
+-- recently created active row active, so the constraint below can be added
+UPDATE github_apis SET is_active = FALSE
+WHERE is_active AND id NOT IN (
+    SELECT DISTINCT ON (user_id) id FROM github_apis
+    WHERE is_active
+    ORDER BY user_id, created_at DESC, id DESC
+);
+
+-- At most one active GitHub API per user. This is an exclusion constraint rather
+-- than a partial unique index so it can be deferred: set_active_api swaps the
+-- active row in a single UPDATE, which a row-by-row unique check would reject.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'github_apis_one_active') THEN
+        ALTER TABLE github_apis ADD CONSTRAINT github_apis_one_active
+            EXCLUDE USING btree (user_id WITH =) WHERE (is_active)
+            DEFERRABLE INITIALLY DEFERRED;
+    END IF;
+END $$;
 
 -- Comments for documentation
 COMMENT ON TABLE users IS 'Telegram users registered with the bot';
@@ -57,5 +88,7 @@ COMMENT ON TABLE repositories IS 'Repository visibility tracking';
 COMMENT ON TABLE audit_logs IS 'Complete audit trail of all bot actions';
 
 COMMENT ON COLUMN github_apis.github_token IS 'Encrypted GitHub personal access token';
+COMMENT ON COLUMN github_apis.token_hash IS 'SHA-256 digest of the token for indexed lookups without decryption';
+COMMENT ON COLUMN github_apis.verified IS 'False while the token is still being validated against GitHub';
 COMMENT ON COLUMN repositories.current_visibility IS 'Current repository visibility: public or private';
 COMMENT ON COLUMN audit_logs.status IS 'Operation result: success or failed';
@@ -6,7 +6,9 @@ Helps with database setup and deployment verification
 
 import os
 import sys
+import hashlib
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 import logging
 
@@ -35,29 +37,33 @@ def check_environment():
     logger.info("✅ All required environment variables are set")
     return True
 
-def test_database_connection():
+def open_connection():
+    """Open the one connection every database check shares"""
+    try:
+        return psycopg2.connect(os.getenv('DATABASE_URL'), cursor_factory=RealDictCursor)
+    except Exception as e:
+        logger.error(f"❌ Could not connect to database: {e}")
+        return None
+
+def test_database_connection(conn):
     """Test connection to Render PostgreSQL database"""
     try:
-        database_url = os.getenv('DATABASE_URL')
         logger.info("🔌 Testing database connection...")
         
-        conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
         with conn.cursor() as cursor:
             cursor.execute("SELECT version();")
             version = cursor.fetchone()
             logger.info(f"✅ Database connection successful: {version['version']}")
         
-        conn.close()
         return True
         
     except Exception as e:
         logger.error(f"❌ Database connection failed: {e}")
         return False
 
-def setup_database_schema():
+def setup_database_schema(conn):
     """Set up database schema from migration file"""
     try:
-        database_url = os.getenv('DATABASE_URL')
         logger.info("📋 Setting up database schema...")
         
         # Read migration file
@@ -65,89 +71,120 @@ def setup_database_schema():
         with open(migration_file, 'r') as f:
             schema_sql = f.read()
         
-        conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
         with conn.cursor() as cursor:
+            # The script is idempotent, so its commit need not wait for the WAL flush
+            cursor.execute("SET LOCAL synchronous_commit = off")
+            # The whole script goes out as one simple-query message: one round trip
             cursor.execute(schema_sql)
             conn.commit()
             logger.info("✅ Database schema created successfully")
         
-        conn.close()
         return True
         
     except Exception as e:
         logger.error(f"❌ Database schema setup failed: {e}")
         return False
 
-def verify_tables():
+def _schema_objects(conn):
+    """Get the names of public tables and indexes, fetched in one query per run"""
+    if conn not in _schema_objects_cache:
+        # A plain cursor: rows are only unpacked, so no dict is built per row
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.execute("""
+                SELECT 'table' AS kind, table_name AS name
+                FROM information_schema.tables
+                WHERE table_schema = 'public'
+                UNION ALL
+                SELECT 'index', indexname
+                FROM pg_indexes
+                WHERE schemaname = 'public'
+            """)
+            objects = {'table': set(), 'index': set()}
+            for kind, name in cursor.fetchall():
+                objects[kind].add(name)
+        _schema_objects_cache[conn] = objects
+    return _schema_objects_cache[conn]
+
+# _schema_objects results per connection, taken after the schema is set up
+_schema_objects_cache = {}
+
+def verify_tables(conn):
     """Verify that all required tables exist"""
     try:
-        database_url = os.getenv('DATABASE_URL')
         logger.info("🔍 Verifying database tables...")
         
         required_tables = ['users', 'github_apis', 'repositories', 'audit_logs']
         
-        conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT table_name 
-                FROM information_schema.tables 
-                WHERE table_schema = 'public'
-            """)
-            existing_tables = [row['table_name'] for row in cursor.fetchall()]
-            
-            missing_tables = [table for table in required_tables if table not in existing_tables]
-            
-            if missing_tables:
-                logger.error(f"❌ Missing tables: {missing_tables}")
-                return False
-            
-            logger.info(f"✅ All required tables exist: {required_tables}")
+        existing_tables = _schema_objects(conn)['table']
+        
+        missing_tables = [table for table in required_tables if table not in existing_tables]
         
-        conn.close()
+        if missing_tables:
+            logger.error(f"❌ Missing tables: {missing_tables}")
+            return False
+        
+        logger.info(f"✅ All required tables exist: {required_tables}")
         return True
         
     except Exception as e:
         logger.error(f"❌ Table verification failed: {e}")
         return False
 
-def verify_indexes():
+def verify_indexes(conn):
     """Verify that all required indexes exist"""
     try:
-        database_url = os.getenv('DATABASE_URL')
         logger.info("🔍 Verifying database indexes...")
         
-        conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT indexname 
-                FROM pg_indexes 
-                WHERE schemaname = 'public'
-            """)
-            existing_indexes = [row['indexname'] for row in cursor.fetchall()]
-            
-            required_indexes = [
-                'idx_users_user_id',
-                'idx_github_apis_user_id', 
-                'idx_github_apis_user_active',
-                'idx_repositories_user_id',
-                'idx_audit_logs_user_id',
-                'idx_audit_logs_timestamp'
-            ]
-            
-            missing_indexes = [idx for idx in required_indexes if idx not in existing_indexes]
-            
-            if missing_indexes:
-                logger.warning(f"⚠️ Missing indexes: {missing_indexes}")
-            else:
-                logger.info(f"✅ All required indexes exist")
+        existing_indexes = _schema_objects(conn)['index']
+        
+        required_indexes = [
+            'idx_users_user_id',
+            'idx_github_apis_user_id', 
+            'idx_github_apis_user_active',
+            'idx_github_apis_token_hash',
+            'idx_repositories_user_id',
+            'idx_audit_logs_user_id',
+            'idx_audit_logs_timestamp',
+            'idx_audit_logs_user_timestamp',
+            'github_apis_one_active'
+        ]
+        
+        missing_indexes = [idx for idx in required_indexes if idx not in existing_indexes]
+        
+        if missing_indexes:
+            logger.warning(f"⚠️ Missing indexes: {missing_indexes}")
+        else:
+            logger.info(f"✅ All required indexes exist")
         
-        conn.close()
         return True
         
     except Exception as e:
         logger.error(f"❌ Index verification failed: {e}")
         return False
 
+def backfill_token_hashes(conn):
+    """Populate token_hash for GitHub APIs stored before the column existed"""
+    try:
+        logger.info("🔑 Backfilling token hashes...")
+
+        sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+        from app.encryption import decrypt_token
+
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id, github_token FROM github_apis WHERE token_hash IS NULL")
+            rows = cursor.fetchall()
+            for row in rows:
+                token_hash = hashlib.sha256(decrypt_token(row['github_token']).encode()).digest()
+                cursor.execute("UPDATE github_apis SET token_hash = %s WHERE id = %s", (token_hash, row['id']))
+            conn.commit()
+            logger.info(f"✅ Backfilled token hashes for {len(rows)} APIs")
+
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Token hash backfill failed: {e}")
+        return False
+
 def test_encryption():
     """Test encryption functionality"""
     try:
@@ -176,21 +213,38 @@ def main():
     """Main deployment verification function"""
     logger.info("🚀 Starting Render deployment verification...")
     
+    # (name, check, whether it takes the shared database connection)
     checks = [
-        ("Environment Variables", check_environment),
-        ("Database Connection", test_database_connection),
-        ("Database Schema", setup_database_schema),
-        ("Table Verification", verify_tables),
-        ("Index Verification", verify_indexes),
-        ("Encryption Test", test_encryption)
+        ("Environment Variables", check_environment, False),
+        ("Database Connection", test_database_connection, True),
+        ("Database Schema", setup_database_schema, True),
+        ("Table Verification", verify_tables, True),
+        ("Index Verification", verify_indexes, True),
+        ("Token Hash Backfill", backfill_token_hashes, True),
+        ("Encryption Test", test_encryption, False)
     ]
     
     failed_checks = []
+    conn = None
     
-    for check_name, check_func in checks:
-        logger.info(f"\n--- {check_name} ---")
-        if not check_func():
-            failed_checks.append(check_name)
+    try:
+        for check_name, check_func, uses_db in checks:
+            logger.info(f"\n--- {check_name} ---")
+            if uses_db:
+                # Opened on first use, so one handshake serves every database check
+                if conn is None:
+                    conn = open_connection()
+                passed = conn is not None and check_func(conn)
+                if not passed and conn is not None and not conn.closed:
+                    # Leave the shared connection usable for the checks that follow
+                    conn.rollback()
+            else:
+                passed = check_func()
+            if not passed:
+                failed_checks.append(check_name)
+    finally:
+        if conn is not None:
+            conn.close()
     
     logger.info("\n" + "="*50)
     logger.info("DEPLOYMENT VERIFICATION SUMMARY")
@@ -4,28 +4,44 @@ Database Test Script for GitHub Repository Visibility Bot
 Tests all database operations with Render PostgreSQL
 """
 
+from __future__ import annotations
+
+import argparse
 import os
+import random
 import sys
 import asyncio
-from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+from uuid import uuid4
+
+# uvloop's event loop when it is installed (it does not support Windows)
+try:
+    from uvloop import new_event_loop
+except ImportError:
+    from asyncio import new_event_loop
 
 # Add parent directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from app.database import Database
-from app.config import Config
 import logging
 
+if TYPE_CHECKING:
+    from app.database import Database
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def test_user_operations():
+# Test user ids are drawn from this range, well above real Telegram ids
+TEST_USER_ID_RANGE = range(10**12, 10**13)
+
+# Audit log records seeded in bulk before the single-record logging test
+TEST_AUDIT_SEED_ROWS = 1000
+
+async def test_user_operations(db: Database, test_user_id: int):
     """Test user-related database operations"""
     logger.info("🧪 Testing user operations...")
     
-    db = Database()
-    test_user_id = 999999999
     test_username = "test_user"
     
     try:
@@ -34,7 +50,9 @@ async def test_user_operations():
         assert success, "User creation failed"
         logger.info("✅ User creation successful")
         
-        # Test user retrieval
+        # Test user retrieval; writes fill the user cache, so drop it to read
+        # back what was committed
+        db._invalidate_user(test_user_id)
         user = await db.get_user(test_user_id)
         assert user is not None, "User retrieval failed"
         assert user['user_id'] == test_user_id, "User ID mismatch"
@@ -45,6 +63,7 @@ async def test_user_operations():
         success = await db.authorize_user(test_user_id)
         assert success, "User authorization failed"
         
+        db._invalidate_user(test_user_id)
         user = await db.get_user(test_user_id)
         assert user['is_authorized'] == True, "User authorization not reflected"
         logger.info("✅ User authorization successful")
@@ -53,6 +72,7 @@ async def test_user_operations():
         success = await db.revoke_user(test_user_id)
         assert success, "User revocation failed"
         
+        db._invalidate_user(test_user_id)
         user = await db.get_user(test_user_id)
         assert user['is_authorized'] == False, "User revocation not reflected"
         logger.info("✅ User revocation successful")
@@ -63,17 +83,19 @@ async def test_user_operations():
         logger.error(f"❌ User operations test failed: {e}")
         return False
 
-async def test_github_api_operations():
+async def test_github_api_operations(db: Database, test_user_id: int):
     """Test GitHub API-related database operations"""
     logger.info("🧪 Testing GitHub API operations...")
     
-    db = Database()
-    test_user_id = 999999999
-    test_api_name = "test_api"
+    test_api_name = f"test_api_{uuid4().hex[:8]}"
     test_token = "ghp_test_token_12345"
     test_username = "test_github_user"
     
     try:
+        # Every table references users(user_id), so the user must exist first
+        success = await db.create_user(test_user_id, "test_user")
+        assert success, "Test user creation failed"
+
         # Test API addition
         success = await db.add_github_api(test_user_id, test_api_name, test_token, test_username)
         assert success, "GitHub API addition failed"
@@ -90,7 +112,9 @@ async def test_github_api_operations():
         assert success, "Setting active API failed"
         logger.info("✅ Setting active API successful")
         
-        # Test getting active API
+        # Test getting active API; set_active_api cached the row, so drop it to
+        # read back what was committed
+        db._invalidate_active_api(test_user_id)
         active_api = await db.get_active_api(test_user_id)
         assert active_api is not None, "No active API found"
         assert active_api['api_name'] == test_api_name, "Active API name mismatch"
@@ -111,17 +135,19 @@ async def test_github_api_operations():
         logger.error(f"❌ GitHub API operations test failed: {e}")
         return False
 
-async def test_repository_operations():
+async def test_repository_operations(db: Database, test_user_id: int):
     """Test repository-related database operations"""
     logger.info("🧪 Testing repository operations...")
     
-    db = Database()
-    test_user_id = 999999999
     test_repo_name = "test-repo"
     test_owner = "test-owner"
     test_visibility = "private"
     
     try:
+        # Every table references users(user_id), so the user must exist first
+        success = await db.create_user(test_user_id, "test_user")
+        assert success, "Test user creation failed"
+
         # Test repository status update
         success = await db.update_repository_status(test_user_id, test_repo_name, test_owner, test_visibility)
         assert success, "Repository status update failed"
@@ -133,17 +159,25 @@ async def test_repository_operations():
         logger.error(f"❌ Repository operations test failed: {e}")
         return False
 
-async def test_audit_operations():
+async def test_audit_operations(db: Database, test_user_id: int):
     """Test audit log-related database operations"""
     logger.info("🧪 Testing audit operations...")
     
-    db = Database()
-    test_user_id = 999999999
     test_action = "test_action"
     test_repository = "test-owner/test-repo"
     test_status = "success"
     
     try:
+        # Every table references users(user_id), so the user must exist first
+        success = await db.create_user(test_user_id, "test_user")
+        assert success, "Test user creation failed"
+
+        # Seed a batch of older records through the bulk write path
+        seed_rows = [("test_seed", f"test-owner/seed-{i}", test_status) for i in range(TEST_AUDIT_SEED_ROWS)]
+        success = await db.bulk_log_action(test_user_id, seed_rows)
+        assert success, "Bulk action logging failed"
+        logger.info(f"✅ Bulk logging of {len(seed_rows)} actions successful")
+
         # Test action logging
         success = await db.log_action(test_user_id, test_action, test_repository, test_status)
         assert success, "Action logging failed"
@@ -151,7 +185,7 @@ async def test_audit_operations():
         
         # Test log retrieval
         logs = await db.get_user_logs(test_user_id, 10)
-        assert len(logs) > 0, "No logs found for user"
+        assert len(logs) == 10, "Log retrieval did not honour the limit"
         assert logs[0]['action'] == test_action, "Action mismatch in logs"
         assert logs[0]['repository'] == test_repository, "Repository mismatch in logs"
         assert logs[0]['status'] == test_status, "Status mismatch in logs"
@@ -163,32 +197,28 @@ async def test_audit_operations():
         logger.error(f"❌ Audit operations test failed: {e}")
         return False
 
-async def cleanup_test_data():
+async def cleanup_test_data(db: Database, test_user_ids: List[int]):
     """Clean up test data from database"""
     logger.info("🧹 Cleaning up test data...")
     
     try:
-        db = Database()
-        test_user_id = 999999999
-        
-        # Get a connection and clean up manually
-        conn = db._get_connection()
-        try:
-            with conn.cursor() as cursor:
-                # Delete in reverse order of dependencies
-                cursor.execute("DELETE FROM audit_logs WHERE user_id = %s", (test_user_id,))
-                cursor.execute("DELETE FROM repositories WHERE user_id = %s", (test_user_id,))
-                cursor.execute("DELETE FROM github_apis WHERE user_id = %s", (test_user_id,))
-                cursor.execute("DELETE FROM users WHERE user_id = %s", (test_user_id,))
-                conn.commit()
-            logger.info("✅ Test data cleanup successful")
-        finally:
-            db._put_connection(conn)
-            
+        def delete(cursor):
+            # One statement, one round trip, for all four tables
+            cursor.execute("""
+                WITH logs AS (DELETE FROM audit_logs WHERE user_id = ANY(%(user_ids)s)),
+                     repos AS (DELETE FROM repositories WHERE user_id = ANY(%(user_ids)s)),
+                     apis AS (DELETE FROM github_apis WHERE user_id = ANY(%(user_ids)s))
+                DELETE FROM users WHERE user_id = ANY(%(user_ids)s)
+            """, {'user_ids': test_user_ids})
+
+        # Run on the database's worker threads so the event loop is not blocked
+        await db._run(delete)
+        logger.info("✅ Test data cleanup successful")
+
     except Exception as e:
         logger.error(f"❌ Test data cleanup failed: {e}")
 
-async def main():
+async def main(pool_size: Optional[int] = None):
     """Main test function"""
     logger.info("🚀 Starting database tests...")
     
@@ -208,23 +238,38 @@ async def main():
         ("Audit Operations", test_audit_operations)
     ]
     
-    failed_tests = []
-    
-    for test_name, test_func in tests:
-        logger.info(f"\n--- {test_name} ---")
+    # Each suite gets its own random user so suites can run concurrently, and a
+    # rerun after an interrupted cleanup does not trip over leftover rows
+    test_user_ids = random.sample(TEST_USER_ID_RANGE, len(tests))
+
+    async def run_test(db, test_name, test_func, test_user_id):
         try:
-            if await test_func():
+            if await test_func(db, test_user_id):
                 logger.info(f"✅ {test_name} passed")
-            else:
-                failed_tests.append(test_name)
-                logger.error(f"❌ {test_name} failed")
+                return True
+            logger.error(f"❌ {test_name} failed")
         except Exception as e:
-            failed_tests.append(test_name)
             logger.error(f"❌ {test_name} failed with exception: {e}")
-    
-    # Cleanup
-    await cleanup_test_data()
-    
+        return False
+
+    # Imported only once the environment checks pass: loading app.config and
+    # app.database pulls in the driver and crypto stack
+    from app.database import Database
+
+    # One Database (and connection pool) shared by every suite; by default the
+    # pool allows every suite two connections at once
+    db = Database(max_size=pool_size or max(8, len(tests) * 2))
+    try:
+        # run_test catches test failures, so one failing suite never cancels the rest
+        async with asyncio.TaskGroup() as tg:
+            results = {test_name: tg.create_task(run_test(db, test_name, test_func, test_user_id))
+                       for (test_name, test_func), test_user_id in zip(tests, test_user_ids)}
+        failed_tests = [test_name for test_name, task in results.items() if not task.result()]
+    finally:
+        # Cleanup, even if the run was interrupted
+        await cleanup_test_data(db, test_user_ids)
+        await db.close()
+
     # Summary
     logger.info("\n" + "="*50)
     logger.info("DATABASE TEST SUMMARY")
@@ -238,4 +283,8 @@ async def main():
         logger.info("Database is ready for production use")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pool-size', type=int, help="maximum database connections to open")
+    args = parser.parse_args()
+    with asyncio.Runner(loop_factory=new_event_loop) as runner:
+        runner.run(main(args.pool_size))